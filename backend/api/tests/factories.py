@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.test import Client, override_settings
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import CustomUser
+
+# Tests must not see entries cached by a running server or other tests
+locmem_cache = override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-tests',
+    }
+})
+
+
+class CacheClearMixin:
+    '''Start every test with an empty cache.'''
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+
+def create_user(username):
+    return CustomUser.objects.create(
+        username=username,
+        email=f'{username}@example.com',
+        first_name=username,
+        last_name=username,
+    )
+
+
+def create_recipe(author, name, tags=(), ingredients=()):
+    '''Create recipe with given tags and {ingredient: amount} mapping.'''
+    recipe = Recipe.objects.create(
+        author=author,
+        name=name,
+        text=name,
+        cooking_time=10,
+        image='recipes/images/test.png',
+    )
+    recipe.tags.set(tags)
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=amount)
+        for ingredient, amount in dict(ingredients).items()
+    )
+    return recipe
+
+
+def create_tags(count):
+    return [
+        Tag.objects.create(
+            name=f'tag {number}', color=f'#{number:06d}', slug=f'tag-{number}'
+        )
+        for number in range(count)
+    ]
+
+
+def create_ingredients(count):
+    return [
+        Ingredient.objects.create(name=f'ingredient {number}',
+                                  measurement_unit='g')
+        for number in range(count)
+    ]
+
+
+def get_client(user=None):
+    '''Get API client authenticated with user's token, if given.'''
+    if user is None:
+        return Client(SERVER_NAME='localhost')
+    token, _ = Token.objects.get_or_create(user=user)
+    return Client(
+        HTTP_AUTHORIZATION=f'Token {token.key}', SERVER_NAME='localhost'
+    )
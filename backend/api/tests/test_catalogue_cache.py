@@ -0,0 +1,19 @@
+from django.test import TestCase
+
+from .factories import CacheClearMixin, create_tags, locmem_cache
+from api.v1.cache import get_model_version
+from recipes.models import Tag
+
+
+@locmem_cache
+class CatalogueVersionTest(CacheClearMixin, TestCase):
+    '''Catalogue version changes only once a write is committed.'''
+
+    def test_version_bumped_on_commit(self):
+        version = get_model_version(Tag)
+        with self.captureOnCommitCallbacks() as callbacks:
+            create_tags(1)
+        self.assertEqual(get_model_version(Tag), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(get_model_version(Tag), version)
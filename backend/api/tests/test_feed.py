@@ -0,0 +1,51 @@
+from django.test import TestCase, override_settings
+
+from .factories import (CacheClearMixin, create_recipe, create_user,
+                        get_client, locmem_cache)
+from recipes.models import Recipe, TimelineEntry
+
+
+@locmem_cache
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+class FeedTest(CacheClearMixin, TestCase):
+    '''Feed merges timeline with recipes of followed popular authors.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.author = create_user('author')
+        cls.popular = create_user('popular')
+        cls.other = create_user('other')
+        for number in range(4):
+            create_recipe(cls.author, f'author {number}')
+            create_recipe(cls.popular, f'popular {number}')
+        create_recipe(cls.other, 'other')
+
+    def subscribe(self, user, author):
+        response = get_client(user).post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201)
+
+    def test_follow_over_limit_is_not_backfilled(self):
+        self.subscribe(self.other, self.popular)
+        self.subscribe(self.user, self.popular)
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists()
+        )
+
+    def test_feed_pages(self):
+        self.subscribe(self.other, self.popular)
+        self.subscribe(self.user, self.popular)
+        self.subscribe(self.user, self.author)
+        expected = list(Recipe.objects.filter(
+            author__in=(self.author, self.popular)
+        ).order_by('-pub_date', '-id').values_list('id', flat=True))
+        client = get_client(self.user)
+        received = []
+        for page in (1, 2, 3):
+            response = client.get(f'/api/recipes/feed/?page={page}&limit=3')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['count'], len(expected))
+            received += [
+                recipe['id'] for recipe in response.json()['results']
+            ]
+        self.assertEqual(received, expected)
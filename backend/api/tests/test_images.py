@@ -0,0 +1,83 @@
+import base64
+import json
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image
+
+from .factories import (CacheClearMixin, create_ingredients, create_tags,
+                        create_user, get_client, locmem_cache)
+from api.v1.serializers import Base64ImageField
+from recipes.images import ThreadPoolBackend
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def get_image_data():
+    '''Get PNG image as data URL with base64 split into MIME lines.'''
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), 'red').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.encodebytes(
+        buffer.getvalue()
+    ).decode()
+
+
+@locmem_cache
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class Base64ImageFieldTest(CacheClearMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author_client = get_client(create_user('author'))
+        cls.tags = create_tags(1)
+        cls.ingredients = create_ingredients(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def post_recipe(self, **data):
+        return self.author_client.post('/api/recipes/', json.dumps({
+            'name': 'recipe',
+            'text': 'text',
+            'cooking_time': 10,
+            'tags': [self.tags[0].id],
+            'ingredients': [{'id': self.ingredients[0].id, 'amount': 1}],
+            'image': get_image_data(),
+            **data
+        }), content_type='application/json')
+
+    def test_base64_with_line_breaks(self):
+        self.assertIn('\n', get_image_data())
+        self.assertEqual(self.post_recipe().status_code, 201)
+
+    def test_file_closed_when_other_field_invalid(self):
+        files = []
+        decode = Base64ImageField.decode
+
+        def record(field, data):
+            files.append(decode(field, data))
+            return files[-1]
+
+        with mock.patch.object(Base64ImageField, 'decode', record):
+            response = self.post_recipe(tags=[0])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].closed)
+
+
+class ThreadPoolBackendTest(SimpleTestCase):
+
+    def test_task_error_is_logged(self):
+        def build(name):
+            raise OSError(name)
+
+        backend = ThreadPoolBackend()
+        with self.assertLogs('recipes.images', 'ERROR') as logs:
+            backend.submit(build, 'broken.png')
+            backend.executor.shutdown(wait=True)
+        self.assertIn('broken.png', logs.output[0])
@@ -0,0 +1,77 @@
+import json
+
+from django.test import TestCase
+
+from .factories import (CacheClearMixin, create_tags, create_user,
+                        get_client, locmem_cache)
+from recipes.models import Ingredient, Recipe
+
+
+@locmem_cache
+class RecipeImportTest(CacheClearMixin, TestCase):
+    '''Invalid records are reported without side effects.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_user('admin')
+        cls.admin.is_staff = True
+        cls.admin.save()
+        cls.tags = create_tags(1)
+
+    def get_record(self, **fields):
+        return {
+            'author': 'admin',
+            'name': 'recipe',
+            'text': 'text',
+            'cooking_time': 10,
+            'tags': ['tag-0'],
+            'ingredients': [
+                {'name': 'salt', 'measurement_unit': 'g', 'amount': 1}
+            ],
+            **fields
+        }
+
+    def post_records(self, *records):
+        client = get_client(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                '/api/recipes/import/',
+                ''.join(json.dumps(record) + '\n' for record in records),
+                content_type='application/x-ndjson'
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_malformed_records(self):
+        unhashable = {'name': ['pepper'], 'measurement_unit': 'g',
+                      'amount': 1}
+        result = self.post_records(
+            self.get_record(author=['admin']),
+            self.get_record(tags=[{'slug': 'tag-0'}]),
+            self.get_record(ingredients=[unhashable]),
+            self.get_record(author='unknown', ingredients=[
+                {'name': 'pepper', 'measurement_unit': 'g', 'amount': 1}
+            ]),
+            self.get_record(),
+        )
+        self.assertEqual(result['created'], 1)
+        self.assertEqual(
+            [error['record'] for error in result['errors']], [1, 2, 3, 4]
+        )
+        self.assertEqual(
+            list(Ingredient.objects.values_list('name', flat=True)),
+            ['salt']
+        )
+        self.assertTrue(Recipe.objects.filter(name='recipe').exists())
+
+    def test_created_ingredients_are_searchable(self):
+        client = get_client(self.admin)
+        self.assertEqual(client.get('/api/ingredients/?name=sal').json(), [])
+        self.post_records(self.get_record())
+        self.assertEqual(
+            [
+                ingredient['name'] for ingredient in
+                client.get('/api/ingredients/?name=sal').json()
+            ],
+            ['salt']
+        )
@@ -0,0 +1,66 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .factories import (CacheClearMixin, create_ingredients, create_recipe,
+                        create_tags, create_user, get_client, locmem_cache)
+from recipes.models import Cart, FavoriteRecipe, Follow
+
+
+@locmem_cache
+class RecipeListQueriesTest(CacheClearMixin, TestCase):
+    '''Recipe list costs the same number of queries for any page size.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('reader')
+        cls.tags = create_tags(2)
+        cls.ingredients = create_ingredients(3)
+        cls.authors = [create_user(f'author{number}') for number in range(3)]
+        Follow.objects.create(user=cls.user, following=cls.authors[0])
+        cls.recipes = 0
+
+    def add_recipes(self, count):
+        for _ in range(count):
+            self.recipes += 1
+            recipe = create_recipe(
+                self.authors[self.recipes % len(self.authors)],
+                f'recipe {self.recipes}',
+                self.tags,
+                {ingredient: 1 for ingredient in self.ingredients}
+            )
+            FavoriteRecipe.objects.create(user=self.user, recipe=recipe)
+            Cart.objects.create(user=self.user, recipe=recipe)
+
+    def get_list(self, client):
+        # Shared response cache would hide the queryset under test
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get('/api/recipes/?page=1&limit=50')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries), response.json()['results']
+
+    def test_list_queries_do_not_grow_with_recipes(self):
+        for name, client in (
+            ('authenticated', get_client(self.user)),
+            ('anonymous', get_client()),
+        ):
+            with self.subTest(name):
+                self.add_recipes(2)
+                queries, _ = self.get_list(client)
+                self.add_recipes(20)
+                with self.assertNumQueries(queries):
+                    _, results = self.get_list(client)
+                self.assertEqual(len(results), self.recipes)
+
+    def test_user_flags(self):
+        self.add_recipes(3)
+        _, results = self.get_list(get_client(self.user))
+        for recipe in results:
+            self.assertTrue(recipe['is_favorited'])
+            self.assertTrue(recipe['is_in_shopping_cart'])
+            self.assertEqual(
+                recipe['author']['is_subscribed'],
+                recipe['author']['id'] == self.authors[0].id
+            )
@@ -0,0 +1,85 @@
+import json
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .factories import (CacheClearMixin, create_ingredients, create_recipe,
+                        create_tags, create_user, get_client, locmem_cache)
+from recipes.models import RecipeIngredient
+
+WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+@locmem_cache
+class RecipeUpdateWritesTest(CacheClearMixin, TestCase):
+    '''Recipe edit writes only rows of the changed fields.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.tags = create_tags(2)
+        cls.ingredients = create_ingredients(11)
+        cls.recipe = create_recipe(
+            cls.author, 'recipe', cls.tags[:1],
+            {ingredient: 1 for ingredient in cls.ingredients[:10]}
+        )
+        cls.data = {
+            'name': 'recipe',
+            'text': 'recipe',
+            'cooking_time': 10,
+            'tags': [cls.tags[0].id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 1}
+                for ingredient in cls.ingredients[:10]
+            ],
+        }
+
+    def setUp(self):
+        super().setUp()
+        self.client = get_client(self.author)
+
+    def patch(self, data):
+        '''Send PATCH and get response with number of write statements.'''
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{self.recipe.id}/', json.dumps(data),
+                content_type='application/json'
+            )
+        return response, sum(
+            query['sql'].lstrip().upper().startswith(WRITES)
+            for query in context.captured_queries
+        )
+
+    def test_writes(self):
+        amount = [dict(item) for item in self.data['ingredients']]
+        amount[0]['amount'] = 2
+        replaced = self.data['ingredients'][1:] + [
+            {'id': self.ingredients[10].id, 'amount': 1}
+        ]
+        for name, data, writes in (
+            ('unchanged', self.data, 0),
+            ('text', {**self.data, 'text': 'edited'}, 1),
+            ('tags', {**self.data, 'tags': [self.tags[1].id]}, 3),
+            ('amount', {**self.data, 'ingredients': amount}, 2),
+            ('replace', {**self.data, 'ingredients': replaced}, 3),
+        ):
+            with self.subTest(name):
+                response, count = self.patch(data)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(count, writes)
+                self.patch(self.data)
+
+    def test_partial_update(self):
+        response, count = self.patch({'name': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'renamed')
+        self.assertEqual(count, 1)
+        self.assertEqual(
+            RecipeIngredient.objects.filter(recipe=self.recipe).count(), 10
+        )
+
+    def test_invalid_cooking_time(self):
+        response, count = self.patch({'cooking_time': 0})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(count, 0)
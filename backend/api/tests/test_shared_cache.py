@@ -0,0 +1,44 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from .factories import (CacheClearMixin, create_recipe, create_user,
+                        get_client, locmem_cache)
+from api.v1.cache import purge_surrogate_keys
+from api.v1.serializers import ShowRecipeSerializer
+from recipes.models import Recipe
+
+
+@locmem_cache
+class SharedRecipeCacheTest(CacheClearMixin, TestCase):
+    '''Write committed while a response is built outdates its entry.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipe = create_recipe(create_user('author'), 'old')
+
+    def rename_while_serializing(self, path):
+        to_representation = ShowRecipeSerializer.to_representation
+
+        def rename(serializer, instance):
+            data = to_representation(serializer, instance)
+            Recipe.objects.filter(pk=self.recipe.pk).update(name='new')
+            purge_surrogate_keys(f'recipe-{self.recipe.pk}', 'recipes')
+            return data
+
+        client = get_client()
+        with mock.patch.object(
+            ShowRecipeSerializer, 'to_representation', rename
+        ):
+            client.get(path)
+        return client.get(path).json()
+
+    def test_detail(self):
+        data = self.rename_while_serializing(
+            f'/api/recipes/{self.recipe.pk}/'
+        )
+        self.assertEqual(data['name'], 'new')
+
+    def test_list(self):
+        data = self.rename_while_serializing('/api/recipes/?limit=10')
+        self.assertEqual(data['results'][0]['name'], 'new')
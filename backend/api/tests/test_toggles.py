@@ -0,0 +1,145 @@
+import json
+import threading
+from collections import Counter
+from unittest import mock
+
+from django.db import IntegrityError, connection
+from django.test import (TestCase, TransactionTestCase,
+                         skipUnlessDBFeature)
+from rest_framework.exceptions import ValidationError
+
+from .factories import (CacheClearMixin, create_ingredients, create_recipe,
+                        create_user, get_client, locmem_cache)
+from api.v1.mixins import insert_unique
+from api.v1.serializers import FavoriteRecipeSerializer
+from recipes.models import Cart, FavoriteRecipe, Follow, ShoppingListItem
+
+THREADS = 8
+ROUNDS = 5
+
+
+# Threads use their own connections, in-memory SQLite locks whole tables
+@skipUnlessDBFeature('has_select_for_update')
+@locmem_cache
+class ConcurrentTogglesTest(CacheClearMixin, TransactionTestCase):
+    '''Concurrent toggles succeed once and keep counters exact.'''
+
+    def setUp(self):
+        super().setUp()
+        self.user = create_user('user')
+        self.author = create_user('author')
+        self.recipe = create_recipe(
+            self.author, 'recipe', ingredients={create_ingredients(1)[0]: 5}
+        )
+        # Token is created once, not by racing threads
+        get_client(self.user)
+
+    def request(self, method, path, data=None):
+        client = get_client(self.user)
+        if data is None:
+            return getattr(client, method)(path)
+        return getattr(client, method)(
+            path, json.dumps(data), content_type='application/json'
+        )
+
+    def hammer(self, requests):
+        '''Send (method, path, data) requests from threads at once.'''
+        barrier = threading.Barrier(len(requests))
+        responses = [None] * len(requests)
+
+        def worker(number, method, path, data):
+            try:
+                barrier.wait()
+                responses[number] = self.request(method, path, data)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(number, *request))
+            for number, request in enumerate(requests)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def assertCountersExact(self):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            self.recipe.favorites_count,
+            FavoriteRecipe.objects.filter(recipe=self.recipe).count()
+        )
+        self.assertEqual(
+            self.recipe.cart_count,
+            Cart.objects.filter(recipe=self.recipe).count()
+        )
+        self.assertEqual(
+            self.author.followers_count,
+            Follow.objects.filter(following=self.author).count()
+        )
+        self.assertEqual(
+            list(ShoppingListItem.objects.filter(
+                user=self.user
+            ).values_list('total_amount', flat=True)),
+            [5] * Cart.objects.filter(user=self.user).count()
+        )
+
+    def test_single_toggles(self):
+        for path in (
+            f'/api/recipes/{self.recipe.id}/favorite/',
+            f'/api/recipes/{self.recipe.id}/shopping_cart/',
+            f'/api/users/{self.author.id}/subscribe/',
+        ):
+            for _ in range(ROUNDS):
+                for method, success in (('post', 201), ('delete', 204)):
+                    with self.subTest(path=path, method=method):
+                        statuses = Counter(
+                            response.status_code
+                            for response in self.hammer(
+                                [(method, path, None)] * THREADS
+                            )
+                        )
+                        self.assertEqual(
+                            statuses, {success: 1, 400: THREADS - 1}
+                        )
+                        self.assertCountersExact()
+
+    def test_single_and_bulk_toggles(self):
+        data = {'recipes': [self.recipe.id]}
+        for single, bulk in (
+            (f'/api/recipes/{self.recipe.id}/favorite/',
+             '/api/recipes/favorite/'),
+            (f'/api/recipes/{self.recipe.id}/shopping_cart/',
+             '/api/recipes/shopping_cart/'),
+        ):
+            for _ in range(ROUNDS):
+                for method in ('post', 'delete'):
+                    with self.subTest(path=bulk, method=method):
+                        self.hammer([
+                            (method, single, None), (method, bulk, data)
+                        ] * (THREADS // 2))
+                        self.assertCountersExact()
+
+
+class InsertUniqueTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.recipe = create_recipe(create_user('author'), 'recipe')
+
+    def test_other_integrity_error_is_raised(self):
+        favorite = FavoriteRecipe(user=self.user, recipe=self.recipe)
+        with mock.patch.object(
+            FavoriteRecipe, 'save', side_effect=IntegrityError
+        ):
+            with self.assertRaises(IntegrityError):
+                insert_unique(favorite, FavoriteRecipeSerializer)
+
+    def test_duplicate_is_validation_error(self):
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        favorite = FavoriteRecipe(user=self.user, recipe=self.recipe)
+        with self.assertRaises(ValidationError):
+            insert_unique(favorite, FavoriteRecipeSerializer)
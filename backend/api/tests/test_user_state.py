@@ -0,0 +1,52 @@
+from django.test import TestCase
+
+from .factories import (CacheClearMixin, create_recipe, create_user,
+                        get_client, locmem_cache)
+from api.v1.cache import get_user_state
+from recipes.models import Cart, FavoriteRecipe, Follow
+
+
+@locmem_cache
+class UserStateTest(CacheClearMixin, TestCase):
+    '''Cached user state follows writes made outside of the API too.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.author = create_user('author')
+        cls.recipe = create_recipe(cls.author, 'recipe')
+
+    def get_recipe(self):
+        return get_client(self.user).get(
+            f'/api/recipes/{self.recipe.pk}/'
+        ).json()
+
+    def test_orm_writes(self):
+        self.assertFalse(self.get_recipe()['is_favorited'])
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+            Cart.objects.create(user=self.user, recipe=self.recipe)
+            Follow.objects.create(user=self.user, following=self.author)
+        data = self.get_recipe()
+        self.assertTrue(data['is_favorited'])
+        self.assertTrue(data['is_in_shopping_cart'])
+        self.assertTrue(data['author']['is_subscribed'])
+
+    def test_cascade_delete(self):
+        FavoriteRecipe.objects.create(user=self.user, recipe=self.recipe)
+        self.assertEqual(
+            get_user_state(self.user)['favorites'], {self.recipe.pk}
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.delete()
+        self.assertEqual(get_user_state(self.user)['favorites'], set())
+
+    def test_api_toggles(self):
+        client = get_client(self.user)
+        for method, flag in (('post', True), ('delete', False)):
+            with self.subTest(method):
+                with self.captureOnCommitCallbacks(execute=True):
+                    getattr(client, method)(
+                        f'/api/recipes/{self.recipe.pk}/favorite/'
+                    )
+                self.assertEqual(self.get_recipe()['is_favorited'], flag)
@@ -0,0 +1,127 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, Value
+from django.utils.http import urlencode
+
+from recipes.models import Cart, FavoriteRecipe, Follow
+
+# Cached id sets of user's relations: model, id field and state name
+USER_STATE = (
+    (FavoriteRecipe, 'recipe_id', 'favorites'),
+    (Cart, 'recipe_id', 'cart'),
+    (Follow, 'following_id', 'following'),
+)
+
+
+def get_model_version(model):
+    '''Get cache version of model data, which changes on every write.'''
+    key = f'version:{model._meta.label_lower}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time()), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_model(model):
+    '''Make every cached response of model data outdated.'''
+    key = f'version:{model._meta.label_lower}'
+    version = cache.get(key) or 0
+    cache.set(key, max(int(time.time()), version + 1), None)
+
+
+def get_response_key(model, version, action, kwargs, query_params):
+    '''Build cache key from request parameters normalized by name.'''
+    params = urlencode(sorted(query_params.lists()), doseq=True)
+    lookup = urlencode(sorted(kwargs.items()))
+    return (
+        f'response:{model._meta.label_lower}:{version}:'
+        f'{action}:{lookup}:{params}'
+    )
+
+
+def get_etag(key):
+    return '"{}"'.format(hashlib.md5(key.encode()).hexdigest())
+
+
+def cache_response_data(key, data):
+    cache.set(key, data, settings.CATALOGUE_CACHE_TIMEOUT)
+
+
+def get_surrogate_versions(keys):
+    '''Get versions of surrogate keys, creating missing ones.'''
+    versions = cache.get_many([f'surrogate:{key}' for key in keys])
+    result = {}
+    for key in keys:
+        version = versions.get(f'surrogate:{key}')
+        if version is None:
+            cache.add(f'surrogate:{key}', time.time_ns(), None)
+            version = cache.get(f'surrogate:{key}')
+        result[key] = version
+    return result
+
+
+def purge_surrogate_keys(*keys):
+    '''Make every cached response tagged with any of keys outdated.'''
+    versions = cache.get_many([f'surrogate:{key}' for key in keys])
+    cache.set_many({
+        f'surrogate:{key}': max(
+            time.time_ns(), versions.get(f'surrogate:{key}', 0) + 1
+        )
+        for key in keys
+    }, None)
+
+
+def get_recipe_surrogate_keys(recipes):
+    '''Get keys of recipes, authors, tags and ingredients in recipe data.'''
+    keys = set()
+    for recipe in recipes:
+        keys.add(f'recipe-{recipe["id"]}')
+        keys.add(f'user-{recipe["author"]["id"]}')
+        keys.update(f'tag-{tag["id"]}' for tag in recipe['tags'])
+        keys.update(
+            f'ingredient-{ingredient["id"]}'
+            for ingredient in recipe['ingredients']
+        )
+    return sorted(keys)
+
+
+def get_user_state_version(user_id):
+    '''Get version of user's cached state, which changes on every write.'''
+    key = f'user_state_version:{user_id}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_user_state(user):
+    '''Get ids of user's favorite and cart recipes and followed authors.
+
+    Sets are loaded together in one query and stored under the version
+    read before it, so a write committed meanwhile outdates them.
+    '''
+    key = f'user_state:{user.pk}:{get_user_state_version(user.pk)}'
+    state = cache.get(key)
+    if state is not None:
+        return state
+    querysets = [
+        model.objects.filter(user_id=user.pk).order_by().annotate(
+            state=Value(name, output_field=CharField())
+        ).values_list(field, 'state')
+        for model, field, name in USER_STATE
+    ]
+    state = {name: set() for _, _, name in USER_STATE}
+    for object_id, name in querysets[0].union(*querysets[1:], all=True):
+        state[name].add(object_id)
+    cache.add(key, state, settings.USER_STATE_CACHE_TIMEOUT)
+    return state
+
+
+def invalidate_user_state(user_id):
+    '''Make cached state of user outdated.'''
+    cache.delete(f'user_state_version:{user_id}')
@@ -1,6 +1,13 @@
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.filters import BaseFilterBackend
 
 from recipes.models import Ingredient, Recipe, Tag
+from recipes.search import search_recipes
+
+RECIPE_ORDERINGS = {
+    'popular': ('-favorites_count', '-pub_date', '-id'),
+    'trending': ('-trending_score', '-pub_date', '-id'),
+}
 
 
 class RecipeFilter(FilterSet):
@@ -15,17 +22,30 @@ class RecipeFilter(FilterSet):
     is_in_shopping_cart = filters.BooleanFilter(
         method='if_in_shopping_cart'
     )
+    ordering = filters.ChoiceFilter(
+        choices=[(name, name) for name in RECIPE_ORDERINGS],
+        method='order'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+            'ordering'
+        )
 
     def if_favorited(self, queryset, value, data):
-        if self.request.user.is_authenticated and value:
-            return queryset.filter(favorites__user=self.request.user)
+        if data:
+            return queryset.filter(is_favorited=True)
+        return queryset
 
     def if_in_shopping_cart(self, queryset, value, data):
-        return queryset.filter(cart__user=self.request.user)
+        if data:
+            return queryset.filter(is_in_shopping_cart=True)
+        return queryset
+
+    def order(self, queryset, value, data):
+        return queryset.order_by(*RECIPE_ORDERINGS[data])
 
 
 class IngredientFilter(FilterSet):
@@ -35,3 +55,13 @@ class IngredientFilter(FilterSet):
     class Meta:
         model = Ingredient
         fields = ('name', )
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    '''Full-text recipe search by 'search' query param ranked by relevance.'''
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get('search', '').strip()
+        if not query:
+            return queryset
+        return search_recipes(queryset, query)
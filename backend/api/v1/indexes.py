@@ -0,0 +1,60 @@
+import sys
+import threading
+from bisect import bisect_left
+
+from .cache import get_model_version
+from recipes.models import Ingredient
+
+
+class IngredientNameIndex:
+    '''In-memory case-insensitive ingredient name index for autocomplete.
+
+    Names are kept casefolded in a sorted list, so prefix matches are found
+    with binary search. The index is built on first use and rebuilt when
+    ingredient cache version changes.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        # Keys and rows are replaced together, searches read one snapshot
+        self._data = ([], [])
+
+    def build(self):
+        rows = sorted(
+            Ingredient.objects.order_by().values_list(
+                'id', 'name', 'measurement_unit'
+            ),
+            key=lambda row: (row[1].casefold(), row[0])
+        )
+        keys = [name.casefold() for _, name, _ in rows]
+        rows = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for pk, name, measurement_unit in rows
+        ]
+        self._data = (keys, rows)
+
+    def refresh(self):
+        '''Rebuild index if ingredient data changed since the last build.'''
+        version = get_model_version(Ingredient)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.build()
+                self._version = version
+
+    def search(self, name):
+        '''Get prefix matches first, then other substring matches.'''
+        self.refresh()
+        keys, rows = self._data
+        prefix = name.casefold()
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + chr(sys.maxunicode), start)
+        return rows[start:end] + [
+            row for index, row in enumerate(rows)
+            if (index < start or index >= end) and prefix in keys[index]
+        ]
+
+
+ingredient_index = IngredientNameIndex()
@@ -0,0 +1,133 @@
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+logger = logging.getLogger('api.metrics')
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+NUMBER_RE = re.compile(r'\b\d+\b')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+VALUES_RE = re.compile(r'\(\s*(?:(?:%s|\?)\s*,\s*)*(?:%s|\?)\s*\)')
+PROJECT_DIR = str(settings.BASE_DIR)
+
+
+def fingerprint(sql):
+    '''Normalize SQL so queries differing by parameters match.'''
+    sql = STRING_RE.sub('?', NUMBER_RE.sub('?', sql))
+    return VALUES_RE.sub('(...)', sql)
+
+
+def get_project_stack():
+    '''Get call stack frames of project code only.'''
+    return [
+        f'{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno} '
+        f'in {frame.name}'
+        for frame in traceback.extract_stack()[:-3]
+        if frame.filename.startswith(PROJECT_DIR)
+        and 'site-packages' not in frame.filename
+    ]
+
+
+class RequestMetrics:
+    '''Query and timing statistics of a single request.'''
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.timings = Counter()
+        self.fingerprints = Counter()
+        self.stacks = {}
+        self._depth = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        '''Database execute wrapper recording every query.'''
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            key = fingerprint(sql)
+            self.fingerprints[key] += 1
+            if key not in self.stacks:
+                self.stacks[key] = get_project_stack()
+
+    @contextmanager
+    def timer(self, name):
+        '''Add time of the outermost block with this name.'''
+        self._depth[name] += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth[name] -= 1
+            if not self._depth[name]:
+                self.timings[name] += time.perf_counter() - started
+
+    @property
+    def duplicates(self):
+        return {
+            sql: count for sql, count in self.fingerprints.items()
+            if count > 1
+        }
+
+    def server_timing(self, total):
+        metrics = [
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.queries} queries"'
+        ]
+        metrics.extend(
+            f'{name};dur={duration * 1000:.1f}'
+            for name, duration in self.timings.items()
+        )
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+    def as_dict(self, request, response, view_name, total):
+        return {
+            'method': request.method,
+            'path': request.path,
+            'view': view_name,
+            'status': response.status_code,
+            'queries': self.queries,
+            'duplicate_queries': sum(self.duplicates.values()),
+            'sql_ms': round(self.sql_time * 1000, 2),
+            **{
+                f'{name}_ms': round(duration * 1000, 2)
+                for name, duration in self.timings.items()
+            },
+            'total_ms': round(total * 1000, 2),
+        }
+
+
+@contextmanager
+def timer(name):
+    '''Time block of code as a part of current request metrics.'''
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    with metrics.timer(name):
+        yield
+
+
+class TimedSerializerMixin:
+    '''Account object serialization in request serializer time.'''
+
+    def to_representation(self, instance):
+        with timer('serializer'):
+            return super().to_representation(instance)
+
+
+def log_sink(data):
+    '''Default sink of sampled request metrics.'''
+    logger.info(json.dumps(data, ensure_ascii=False))
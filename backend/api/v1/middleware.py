@@ -0,0 +1,63 @@
+import json
+import random
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from .metrics import RequestMetrics, current_metrics, logger
+
+
+class RequestMetricsMiddleware:
+    '''Report SQL queries and timings of request in headers and logs.'''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = settings.REQUEST_METRICS_QUERY_THRESHOLD
+        self.sample_rate = settings.REQUEST_METRICS_SAMPLE_RATE
+        self.sink = (
+            import_string(settings.REQUEST_METRICS_SINK)
+            if settings.REQUEST_METRICS_SINK else None
+        )
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        total = time.perf_counter() - metrics.started
+        response['Server-Timing'] = metrics.server_timing(total)
+
+        view_name = getattr(request, 'metrics_view_name', None)
+        data = metrics.as_dict(request, response, view_name, total)
+        logger.debug(json.dumps(data, ensure_ascii=False))
+        if self.sink and random.random() < self.sample_rate:
+            self.sink(data)
+        if self.threshold and metrics.queries > self.threshold:
+            self.log_queries(view_name, metrics)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'cls', view_func)
+        actions = getattr(view_func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        request.metrics_view_name = '.'.join(filter(None, (
+            view.__module__, view.__qualname__, action
+        )))
+
+    def log_queries(self, view_name, metrics):
+        duplicates = sorted(
+            metrics.duplicates.items(), key=lambda item: -item[1]
+        )
+        lines = [
+            f'{view_name}: {metrics.queries} queries, '
+            f'{metrics.sql_time * 1000:.1f} ms'
+        ]
+        for sql, count in duplicates[:5]:
+            lines.append(f'{count} x {sql}')
+            lines.extend(f'    {frame}' for frame in metrics.stacks[sql])
+        logger.warning('\n'.join(lines))
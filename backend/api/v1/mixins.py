@@ -1,30 +1,329 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import Http404
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.validators import UniqueTogetherValidator
+
+from .cache import (cache_response_data, get_etag, get_model_version,
+                    get_recipe_surrogate_keys, get_response_key,
+                    get_surrogate_versions, get_user_state,
+                    invalidate_user_state)
+from .serializers import RecipeIdsSerializer
+from recipes.counters import COUNTER_FIELDS, change_counter, change_counters
+from recipes.models import Cart, Recipe, ShoppingListItem
+from users.models import CustomUser
+
+
+def insert_unique(obj, serializer):
+    '''Insert object in one statement, unique conflict is a 400 error.
+
+    The unique constraint decides instead of a preceding existence query,
+    so concurrent requests can't create duplicates. Other integrity errors
+    (e.g. a deleted recipe or user) are not reported as duplicates.
+    '''
+    validator = next(
+        validator for validator in serializer.Meta.validators
+        if isinstance(validator, UniqueTogetherValidator)
+    )
+    try:
+        with transaction.atomic():
+            obj.save(force_insert=True)
+    except IntegrityError:
+        duplicate = type(obj).objects.filter(**{
+            field: getattr(obj, field) for field in validator.fields
+        })
+        if not duplicate.exists():
+            raise
+        raise ValidationError(
+            {api_settings.NON_FIELD_ERRORS_KEY: [validator.message]},
+            code='unique'
+        )
+
+
+def lock_user(user):
+    '''Serialize concurrent changes of the same user's recipe lists.
+
+    Every API path changing favorites or cart takes the lock, so rows
+    selected by bulk changes are not changed by other requests meanwhile.
+    '''
+    CustomUser.objects.select_for_update().filter(pk=user.pk).exists()
 
 
 class CreateDeleteObjMixin:
     '''Mixin for adding sample recipe-related create/delete methods.'''
 
     def create_obj(self, instance, serializer, request):
-        serializer = serializer(
-            data={
-                'user': request.user.id,
-                'recipe': instance.id,
-            },
-            context={
-                'request': request
-            }
+        model = serializer.Meta.model
+        obj = model(user=request.user, recipe=instance)
+        with transaction.atomic():
+            lock_user(request.user)
+            insert_unique(obj, serializer)
+            change_counter(Recipe, instance.id, COUNTER_FIELDS[model], 1)
+            if model is Cart:
+                ShoppingListItem.objects.add_recipe(request.user, instance)
+        return Response(
+            serializer(obj, context={'request': request}).data,
+            status=status.HTTP_201_CREATED
         )
 
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    def delete_obj(self, instance, model, request, error):
-        if model.objects.filter(user=request.user, recipe=instance).exists():
-            model.objects.filter(user=request.user, recipe=instance).delete()
+    def delete_obj(self, recipe_id, model, request, error):
+        with transaction.atomic():
+            lock_user(request.user)
+            deleted, _ = model.objects.filter(
+                user=request.user, recipe_id=recipe_id
+            ).delete()
+            change_counter(Recipe, recipe_id, COUNTER_FIELDS[model], -deleted)
+            if deleted and model is Cart:
+                ShoppingListItem.objects.remove_recipes(
+                    request.user, [recipe_id]
+                )
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        if not Recipe.objects.filter(pk=recipe_id).exists():
+            raise Http404
         return Response(
             {'errors': error, },
             status=status.HTTP_400_BAD_REQUEST
         )
+
+
+class BulkObjMixin:
+    '''Mixin adding and removing many user's recipe relations at once.'''
+
+    def get_recipe_ids(self, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return list(dict.fromkeys(serializer.validated_data['recipes']))
+
+    def create_objs(self, model, request):
+        recipe_ids = self.get_recipe_ids(request)
+        found = set(
+            Recipe.objects.filter(pk__in=recipe_ids).values_list(
+                'pk', flat=True
+            )
+        )
+        with transaction.atomic():
+            lock_user(request.user)
+            present = set(
+                model.objects.filter(
+                    user=request.user, recipe_id__in=found
+                ).values_list('recipe_id', flat=True)
+            )
+            added = [
+                recipe_id for recipe_id in recipe_ids
+                if recipe_id in found and recipe_id not in present
+            ]
+            model.objects.bulk_create(
+                [
+                    model(user=request.user, recipe_id=recipe_id)
+                    for recipe_id in added
+                ],
+                ignore_conflicts=True
+            )
+            change_counters(Recipe, added, COUNTER_FIELDS[model], 1)
+            if model is Cart:
+                ShoppingListItem.objects.add_recipes(request.user, added)
+            # Bulk insert sends no signals
+            transaction.on_commit(
+                lambda: invalidate_user_state(request.user.pk)
+            )
+        statuses = dict.fromkeys(present, 'exists')
+        statuses.update(dict.fromkeys(added, 'added'))
+        return self.bulk_response(recipe_ids, statuses)
+
+    def delete_objs(self, model, request):
+        recipe_ids = self.get_recipe_ids(request)
+        with transaction.atomic():
+            lock_user(request.user)
+            objs = model.objects.filter(
+                user=request.user, recipe_id__in=recipe_ids
+            )
+            # Locked rows can't be deleted by writes bypassing the user lock
+            removed = list(
+                objs.select_for_update().values_list('recipe_id', flat=True)
+            )
+            objs.delete()
+            change_counters(Recipe, removed, COUNTER_FIELDS[model], -1)
+            if model is Cart:
+                ShoppingListItem.objects.remove_recipes(request.user, removed)
+        return self.bulk_response(
+            recipe_ids, dict.fromkeys(removed, 'removed')
+        )
+
+    def clear_objs(self, model, request):
+        with transaction.atomic():
+            lock_user(request.user)
+            objs = model.objects.filter(user=request.user)
+            removed = list(
+                objs.select_for_update().values_list('recipe_id', flat=True)
+            )
+            objs.delete()
+            change_counters(Recipe, removed, COUNTER_FIELDS[model], -1)
+            if model is Cart:
+                ShoppingListItem.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def bulk_response(self, recipe_ids, statuses):
+        return Response({
+            'results': [
+                {
+                    'id': recipe_id,
+                    'status': statuses.get(recipe_id, 'not_found')
+                }
+                for recipe_id in recipe_ids
+            ]
+        })
+
+
+class CachedReadOnlyMixin:
+    '''Mixin caching serialized list/retrieve responses until data change.'''
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        model = self.queryset.model
+        version = get_model_version(model)
+        key = get_response_key(
+            model, version, self.action, kwargs, request.query_params
+        )
+        etag = get_etag(key)
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=version
+        )
+        if not_modified is not None:
+            return not_modified
+
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache_response_data(key, data)
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(version)
+        return response
+
+
+class SharedRecipeCacheMixin:
+    '''Mixin caching user-independent recipe list/retrieve responses.
+
+    Entries keep versions of surrogate keys of recipes, authors, tags and
+    ingredients they contain and get outdated once any of them is purged.
+    Lists are also tagged with the key purged on every recipe write.
+    Authenticated users get shared entries with their own state flags.
+    '''
+    # Filters making the list itself depend on user
+    user_filters = ('is_favorited', 'is_in_shopping_cart')
+
+    def list(self, request, *args, **kwargs):
+        return self.get_shared_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_shared_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_recipes(self, data):
+        if self.action != 'list':
+            return [data]
+        # Lists are paginated only when page or limit is requested
+        return data['results'] if isinstance(data, dict) else data
+
+    def get_surrogate_keys(self, data):
+        keys = get_recipe_surrogate_keys(self.get_recipes(data))
+        return ['recipes', *keys] if self.action == 'list' else keys
+
+    def with_state(self, data, favorites=(), cart=(), following=()):
+        '''Copy response data setting user state flags of recipes.'''
+        recipes = [
+            {
+                **recipe,
+                'author': {
+                    **recipe['author'],
+                    'is_subscribed': recipe['author']['id'] in following,
+                },
+                'is_favorited': recipe['id'] in favorites,
+                'is_in_shopping_cart': recipe['id'] in cart,
+            }
+            for recipe in self.get_recipes(data)
+        ]
+        if self.action != 'list':
+            return recipes[0]
+        return {**data, 'results': recipes} if isinstance(data, dict) else (
+            recipes
+        )
+
+    def get_shared_response(self, handler, request, *args, **kwargs):
+        user = request.user
+        if user.is_authenticated and any(
+            request.query_params.get(name) for name in self.user_filters
+        ):
+            response = handler(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+            return response
+
+        key = get_response_key(
+            self.queryset.model, 'shared', self.action, kwargs,
+            request.query_params
+        )
+        entry = cache.get(key)
+        if entry is None or (
+            get_surrogate_versions(list(entry['versions']))
+            != entry['versions']
+        ):
+            # Versions read before the query, so a write purging them while
+            # the response is built leaves the stored entry outdated
+            versions = get_surrogate_versions(
+                ['recipes'] if self.action == 'list'
+                else [f'recipe-{kwargs[self.lookup_field]}']
+            )
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = {
+                'data': self.with_state(response.data),
+                'versions': {
+                    **get_surrogate_versions(
+                        self.get_surrogate_keys(response.data)
+                    ),
+                    **versions,
+                },
+            }
+            cache.set(key, entry, (
+                settings.ANONYMOUS_LIST_CACHE_TIMEOUT
+                if self.action == 'list'
+                else settings.ANONYMOUS_CACHE_TIMEOUT
+            ))
+        if user.is_authenticated:
+            response = Response(
+                self.with_state(entry['data'], **get_user_state(user))
+            )
+            patch_cache_control(response, private=True)
+        else:
+            response = Response(entry['data'])
+            response['Surrogate-Key'] = ' '.join(entry['versions'])
+            patch_cache_control(
+                response, public=True, max_age=0,
+                s_maxage=settings.ANONYMOUS_SHARED_CACHE_MAX_AGE
+            )
+        patch_vary_headers(response, ('Authorization',))
+        return response
@@ -1,6 +1,88 @@
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+def estimate_count(queryset):
+    '''Get planner row estimate for unfiltered querysets on big tables.'''
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+            [queryset.model._meta.db_table]
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < settings.PAGINATION_ESTIMATE_THRESHOLD:
+        return None
+    return row[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    '''Paginator using table statistics instead of COUNT(*) when possible.'''
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None:
+            return super().count
+        return estimate
 
 
 class LimitPageNumberPagination(PageNumberPagination):
-    '''Common pagination with item amount 'limit' query param.'''
+    '''Common pagination with item amount 'limit' query param.
+
+    Total count is estimated for big tables with 'count=estimate' param.
+    '''
+    page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get('count') == 'estimate':
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+
+class LimitCursorPagination(CursorPagination):
+    '''Cursor pagination with item amount 'limit' query param.'''
+    page_size = 10
     page_size_query_param = 'limit'
+
+
+class LimitCursorSwitchPagination(LimitPageNumberPagination):
+    '''Page number pagination switching to cursor one by query param.
+
+    Cursor mode is enabled with 'pagination=cursor', it skips COUNT(*) and
+    OFFSET, so deep pages cost the same as the first one. Explicit
+    ordering of queryset (e.g. by filters) is kept.
+    '''
+    cursor_ordering = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if request.query_params.get('pagination') == 'cursor':
+            self.cursor_paginator = LimitCursorPagination()
+            self.cursor_paginator.ordering = (
+                queryset.query.order_by or self.cursor_ordering
+            )
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(LimitCursorSwitchPagination):
+    '''Recipe feed pagination, cursor is keyed on publication date.'''
+    cursor_ordering = ('-pub_date', '-id')
+
+
+class SubscriptionPagination(LimitCursorSwitchPagination):
+    '''Subscriptions pagination, cursor is keyed on follow id.'''
+    cursor_ordering = ('-follow_id', )
@@ -1,15 +1,28 @@
 import base64
+import binascii
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from django.db import transaction
+from PIL import Image
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 from rest_framework.validators import UniqueTogetherValidator, ValidationError
 
 from recipes.models import (Cart, FavoriteRecipe, Follow, Ingredient, Recipe,
-                            RecipeIngredient, Tag)
+                            RecipeIngredient, ShoppingListItem, Tag)
+from recipes.counters import change_counter
+from recipes.images import schedule_renditions
+from recipes.indexing import recipe_changed
+from recipes.timelines import fan_out
 from users.models import CustomUser
 
+from .cache import get_user_state
+from .metrics import TimedSerializerMixin
+
 
 class CreateUserSerializer(UserSerializer):
     '''Serializer to work with user creation requests.'''
@@ -50,24 +63,96 @@ class ShowUserSerializer(UserSerializer):
 
     def get_is_subscribed(self, following):
         '''Get subscriptions info in api response.'''
+        if hasattr(following, 'is_subscribed'):
+            return following.is_subscribed
         user = self.context.get('request').user
         return (
             user.is_authenticated
-            and user.follower.filter(
-                following=following
-            ).exists()
+            and following.id in get_user_state(user)['following']
         )
 
 
 class Base64ImageField(serializers.ImageField):
     '''Decode image to base64 and save to static.'''
+    chunk_size = 256 * 1024
+
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
+        if not (isinstance(data, str) and data.startswith('data:image')):
+            return super().to_internal_value(data)
+        # Kept to be closed if other fields of the serializer are invalid
+        self.file = self.decode(data)
+        try:
+            return super().to_internal_value(self.file)
+        except serializers.ValidationError:
+            self.close()
+            raise
+
+    def close(self):
+        '''Close decoded temporary file, if any.'''
+        file = getattr(self, 'file', None)
+        if file is not None:
+            file.close()
+            self.file = None
+
+    def decode(self, data):
+        '''Decode image by chunks to temporary file checking its size.'''
+        try:
             format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+        except ValueError:
+            raise serializers.ValidationError('Некорректное изображение.')
+        # Line breaks are allowed in base64 but rejected by strict decoding
+        imgstr = ''.join(imgstr.split())
+        if len(imgstr) // 4 * 3 > settings.IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                'Размер изображения превышает допустимый.'
+            )
+        content_type = format.split(':')[-1]
+        ext = content_type.split('/')[-1]
+        file = TemporaryUploadedFile(
+            'temp.' + ext, content_type, len(imgstr) // 4 * 3, None
+        )
+        try:
+            for start in range(0, len(imgstr), self.chunk_size):
+                file.write(base64.b64decode(
+                    imgstr[start:start + self.chunk_size], validate=True
+                ))
+        except (binascii.Error, ValueError):
+            file.close()
+            raise serializers.ValidationError('Некорректное изображение.')
+        file.size = file.tell()
+        file.seek(0)
+        self.check_dimensions(file)
+        return file
+
+    def check_dimensions(self, file):
+        '''Reject huge images reading only their header.'''
+        try:
+            width, height = Image.open(file).size
+        except Exception:
+            file.close()
+            raise serializers.ValidationError('Некорректное изображение.')
+        file.seek(0)
+        if max(width, height) > settings.IMAGE_MAX_DIMENSION:
+            file.close()
+            raise serializers.ValidationError(
+                'Размеры изображения превышают допустимые.'
+            )
 
-        return super().to_internal_value(data)
+
+class ImageRenditionsField(serializers.ReadOnlyField):
+    '''Absolute URLs of resized recipe image copies.'''
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        return {
+            rendition: {
+                extension: request.build_absolute_uri(
+                    default_storage.url(path)
+                ) if request else default_storage.url(path)
+                for extension, path in paths.items()
+            }
+            for rendition, paths in value.items()
+        }
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -97,14 +182,104 @@ class IngredientsInRecipeSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    '''Primary key field able to resolve values of a list in one query.'''
+    instances = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {
+            key: value for key, value in kwargs.items()
+            if key in MANY_RELATION_KWARGS
+        }
+        return BulkManyRelatedField(
+            child_relation=cls(*args, **kwargs), **list_kwargs
+        )
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            raise TypeError
+        return self.get_queryset().model._meta.pk.to_python(data)
+
+    def prefetch(self, values):
+        '''Fetch objects of all valid primary keys in one query.'''
+        pks = set()
+        for value in values:
+            try:
+                if self.pk_field is not None:
+                    value = self.pk_field.to_internal_value(value)
+                pks.add(self.to_pk(value))
+            except (TypeError, ValueError, DjangoValidationError,
+                    ValidationError):
+                continue
+        self.instances = self.get_queryset().in_bulk(pks)
+
+    def to_internal_value(self, data):
+        if self.instances is None:
+            return super().to_internal_value(data)
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        try:
+            instance = self.instances.get(self.to_pk(data))
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if instance is None:
+            self.fail('does_not_exist', pk_value=data)
+        return instance
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    '''Resolve all primary keys of the list in one query.
+
+    Unlike the default field, errors of all invalid values are reported.
+    '''
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            return super().to_internal_value(data)
+        if not self.allow_empty and not data:
+            self.fail('empty')
+        self.child_relation.prefetch(data)
+        instances, errors = [], []
+        try:
+            for item in data:
+                try:
+                    instances.append(
+                        self.child_relation.to_internal_value(item)
+                    )
+                except ValidationError as error:
+                    errors.extend(error.detail)
+        finally:
+            self.child_relation.instances = None
+        if errors:
+            raise ValidationError(errors)
+        return instances
+
+
+class IngredientAmountListSerializer(serializers.ListSerializer):
+    '''Resolve ingredients of all list items in one query.'''
+
+    def to_internal_value(self, data):
+        field = self.child.fields['id']
+        if isinstance(data, list):
+            field.prefetch(
+                item.get('id') for item in data if isinstance(item, dict)
+            )
+        try:
+            return super().to_internal_value(data)
+        finally:
+            field.instances = None
+
+
 class IngredientAmountSerializer(serializers.ModelSerializer):
     '''Serializer to tie ingredient id with it's amount in short form.'''
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = BulkPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
     amount = serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'amount')
+        list_serializer_class = IngredientAmountListSerializer
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -116,7 +291,8 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'color', 'slug')
 
 
-class ShowRecipeSerializer(serializers.ModelSerializer):
+class ShowRecipeSerializer(TimedSerializerMixin,
+                           serializers.ModelSerializer):
     '''Shows RecipeSerializer with additional fields'''
     tags = TagSerializer(read_only=True, many=True,)
     author = ShowUserSerializer(read_only=True)
@@ -125,6 +301,7 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
         many=True,
         source='recipe_ingredient')
     image = Base64ImageField(required=False)
+    image_renditions = ImageRenditionsField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -139,43 +316,57 @@ class ShowRecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_renditions',
             'text',
             'cooking_time'
         )
 
     def get_is_in_shopping_cart(self, cart):
         '''Shows 'Cart' status of recipe.'''
+        if hasattr(cart, 'is_in_shopping_cart'):
+            return cart.is_in_shopping_cart
         user = self.context.get('request').user
         return (
             user.is_authenticated
-            and user.cart.filter(
-                recipe=cart
-            ).exists()
+            and cart.id in get_user_state(user)['cart']
         )
 
     def get_is_favorited(self, favorited):
         '''Shows 'Favorites' status of recipe.'''
+        if hasattr(favorited, 'is_favorited'):
+            return favorited.is_favorited
         user = self.context.get('request').user
         return (
             user.is_authenticated
-            and user.favorites.filter(
-                recipe=favorited
-            ).exists()
+            and favorited.id in get_user_state(user)['favorites']
+        )
+
+
+class CookableRecipeSerializer(ShowRecipeSerializer):
+    '''Recipe info with amount of matched and missing ingredients.'''
+    matched_count = serializers.IntegerField(read_only=True)
+    missing_count = serializers.IntegerField(read_only=True)
+
+    class Meta(ShowRecipeSerializer.Meta):
+        fields = ShowRecipeSerializer.Meta.fields + (
+            'matched_count',
+            'missing_count'
         )
 
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     '''Serializer used in Cart/Favorite endpoints.Gives a short recipe info.'''
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_renditions', 'cooking_time')
         read_only_fields = ('id', 'name', 'image', 'cooking_time')
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     '''Base internal data recipe serializer.'''
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(),
         many=True
     )
@@ -221,32 +412,111 @@ class RecipeSerializer(serializers.ModelSerializer):
         ingredients = validated_data.pop('ingredients')
         instance = Recipe.objects.create(
             author=user, **validated_data)
+        change_counter(CustomUser, user.id, 'recipes_count', 1)
         instance.tags.set(tags)
         self.set_ingredients(instance, ingredients)
+        schedule_renditions(instance)
+        transaction.on_commit(lambda: recipe_changed(instance.pk))
+        transaction.on_commit(lambda: fan_out([instance.pk]))
         return instance
 
+    def update_tags(self, instance, tags):
+        '''Add and remove only changed recipe's tags.'''
+        old_ids = set(instance.tags.values_list('id', flat=True))
+        new_ids = {tag.id for tag in tags}
+        if new_ids - old_ids:
+            instance.tags.add(*(new_ids - old_ids))
+        if old_ids - new_ids:
+            instance.tags.remove(*(old_ids - new_ids))
+        return old_ids != new_ids
+
+    def update_ingredients(self, instance, ingredients):
+        '''Insert, update and delete only changed recipe's ingredients.'''
+        rows = {
+            row.ingredient_id: row
+            for row in RecipeIngredient.objects.filter(recipe=instance)
+        }
+        old_amounts = {pk: row.amount for pk, row in rows.items()}
+        new_amounts = {
+            ingredient.get('id').id: ingredient.get('amount')
+            for ingredient in ingredients
+        }
+        if old_amounts == new_amounts:
+            return False
+
+        deleted = [
+            row.id for pk, row in rows.items() if pk not in new_amounts
+        ]
+        if deleted:
+            RecipeIngredient.objects.filter(id__in=deleted).delete()
+        changed = []
+        for pk, row in rows.items():
+            if pk in new_amounts and row.amount != new_amounts[pk]:
+                row.amount = new_amounts[pk]
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=instance, ingredient_id=pk, amount=amount)
+            for pk, amount in new_amounts.items() if pk not in rows
+        )
+        ShoppingListItem.objects.change_recipe(
+            instance, old_amounts, new_amounts
+        )
+        return True
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        instance.tags.set(tags)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        # Uploaded image is always a new file, other fields are compared
+        fields = [
+            name for name, value in validated_data.items()
+            if name == 'image' or getattr(instance, name) != value
+        ]
+        for name in fields:
+            setattr(instance, name, validated_data[name])
+        changed = bool(fields)
+        if tags is not None:
+            changed |= self.update_tags(instance, tags)
+        if ingredients is not None:
+            changed |= self.update_ingredients(instance, ingredients)
+        if not changed:
+            return instance
+
+        instance.save(update_fields=[*fields, 'updated'])
+        if 'image' in fields:
+            schedule_renditions(instance)
+        transaction.on_commit(lambda: recipe_changed(instance.pk))
+        return instance
 
-        super().update(instance, validated_data)
-        self.set_ingredients(instance, ingredients)
-        instance.save()
+    def run_validation(self, data=serializers.empty):
+        try:
+            return super().run_validation(data)
+        except ValidationError:
+            # Decoded image is not saved when any other field is invalid
+            self.fields['image'].close()
+            raise
+
+    def save(self, **kwargs):
+        instance = super().save(**kwargs)
+        image = self.validated_data.get('image')
+        if image is not None:
+            # Temporary upload file is already moved to the storage
+            image.close()
         return instance
 
     def to_representation(self, instance):
+        request = self.context.get('request')
         return ShowRecipeSerializer(
-            instance,
-            context={'request': self.context.get('request')}
+            Recipe.objects.for_feed(request.user).get(pk=instance.pk),
+            context={'request': request}
         ).data
 
     def validate(self, data):
+        # Partial update may leave out any field
         ingredient_data = []
-        for ingredient in data.get('ingredients'):
+        for ingredient in data.get('ingredients', ()):
             if ingredient.get('amount') < 1:
                 raise serializers.ValidationError(
                     'Количество не может быть меньше 1.'
@@ -255,8 +525,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         if len(set(ingredient_data)) < len(ingredient_data):
             raise serializers.ValidationError(
                 'Нельзя добавить ингредиент дважды.')
-        if data.get('cooking_time') < 1:
-            return serializers.ValidationError(
+        if data.get('cooking_time', 1) < 1:
+            raise serializers.ValidationError(
                 'Введено некорректное время приготовления.'
             )
         return data
@@ -297,7 +567,32 @@ class FavoriteRecipeSerializer(serializers.ModelSerializer):
         ).data
 
 
-class UserRecipesSerializer(serializers.ModelSerializer):
+class RecipeIdsSerializer(serializers.Serializer):
+    '''Validate list of recipe ids for bulk cart and favorites requests.'''
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_MAX
+    )
+
+
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    '''Serializer for ingredient totals of user's shopping list.'''
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit'
+    )
+    amount = serializers.IntegerField(source='total_amount')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+        read_only_fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class UserRecipesSerializer(TimedSerializerMixin,
+                            serializers.ModelSerializer):
     '''Serializes complete user's info with his recipes alltogether.'''
     recipes = serializers.SerializerMethodField()
     is_subscribed = serializers.BooleanField(read_only=True)
@@ -319,10 +614,11 @@ class UserRecipesSerializer(serializers.ModelSerializer):
     def get_recipes(self, obj):
         '''Get user's recipes with query-based recipe limit.'''
         request = self.context.get('request')
-        recipes = obj.author.all()
-        if request:
-            recipes_limit = request.query_params.get('recipes_limit')
-        if recipes_limit:
+        recipes = getattr(obj, 'recipe_previews', None)
+        if recipes is None:
+            recipes = obj.author.all()
+        recipes_limit = request and request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
             recipes = recipes[:int(recipes_limit)]
         return ShortRecipeSerializer(
             recipes, many=True,
@@ -330,7 +626,7 @@ class UserRecipesSerializer(serializers.ModelSerializer):
         ).data
 
     def get_recipes_count(self, obj):
-        return obj.author.count()
+        return obj.recipes_count
 
 
 class FollowSerializer(serializers.ModelSerializer):
@@ -347,7 +643,7 @@ class FollowSerializer(serializers.ModelSerializer):
     def validate(self, data):
         request = self.context['request']
         if request.user == data.get('following'):
-            return ValidationError(
+            raise ValidationError(
                 'Нельзя подписаться на самого себя.'
             )
         return super().validate(data)
@@ -1,57 +1,154 @@
+import csv
 import os
-from io import BytesIO
+from io import BytesIO, StringIO
 
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max
+from django.http import FileResponse, StreamingHttpResponse
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
 from foodgram.settings import BASE_DIR
-from recipes.models import RecipeIngredient
+from recipes.models import Cart, ShoppingListItem
 
+FONT_NAME = 'DejaVuSerif'
+# Absolute path to TrueType cyrillic font
+FONT_PATH = os.path.join(BASE_DIR, 'static/data/DejaVuSerif.ttf')
 
-def create_pdf(request):
-    '''Create PDF cart file.'''
+PAGE_TOP = 740
+PAGE_BOTTOM = 60
+LINE_HEIGHT = 24
 
-    # Absolute path to TrueType cyrillic font
-    path = 'static/data/DejaVuSerif.ttf'
-    pdfmetrics.registerFont(
-        TTFont(
-            'DejaVuSerif', os.path.join(BASE_DIR, path)
-        )
+
+def register_font():
+    '''Register cyrillic font once per process.'''
+    if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+def get_cart_version(user):
+    '''Get value changing whenever user's shopping list contents change.'''
+    version = Cart.objects.filter(user=user).aggregate(
+        count=Count('id'),
+        last_id=Max('id'),
+        updated=Max('recipe__updated'),
     )
-    buffer = BytesIO()
-    doc = canvas.Canvas(buffer, pagesize=letter)
-    doc.setFont('DejaVuSerif', 18)
-    doc.drawCentredString(x=140, y=740, text='Список покупок')
-    textobject = doc.beginText()
-    textobject.setTextOrigin(40, 660)
-    textobject.setFont('DejaVuSerif', 16)
-
-    qs = RecipeIngredient.objects.filter(
-        recipe_id__cart__user=request.user
+    updated = version['updated']
+    return '{}-{}-{}'.format(
+        version['count'],
+        version['last_id'],
+        updated.timestamp() if updated else 0
+    )
+
+
+def get_shopping_list(user):
+    '''Get ingredient totals of all recipes in user's cart.'''
+    return ShoppingListItem.objects.filter(
+        user=user
     ).order_by(
+        'ingredient__name'
     ).values(
         'ingredient__name',
-        'ingredient__measurement_unit'
-    ).annotate(
-        amount=Sum('amount')
+        'ingredient__measurement_unit',
+        amount=F('total_amount')
     )
 
-    for ingredient in qs:
+
+def render_pdf(ingredients):
+    '''Render shopping list as PDF continued on new pages when needed.'''
+    register_font()
+    buffer = BytesIO()
+    doc = canvas.Canvas(buffer, pagesize=letter)
+    doc.setFont(FONT_NAME, 18)
+    doc.drawCentredString(x=140, y=PAGE_TOP, text='Список покупок')
+    y = PAGE_TOP - 80
+    doc.setFont(FONT_NAME, 16)
+
+    for ingredient in ingredients:
+        if y < PAGE_BOTTOM:
+            doc.showPage()
+            doc.setFont(FONT_NAME, 16)
+            y = PAGE_TOP
         name = ingredient['ingredient__name']
         measure = ingredient['ingredient__measurement_unit']
         amount = ingredient['amount']
-        textobject.textLine(f'{name} ({measure}) — {amount}')
-        textobject.moveCursor(0, 8)
+        doc.drawString(40, y, f'{name} ({measure}) — {amount}')
+        y -= LINE_HEIGHT
 
-    doc.drawText(textobject)
     doc.showPage()
     doc.save()
+    yield buffer.getvalue()
 
-    buffer.seek(0)
 
-    return FileResponse(
-        buffer, as_attachment=True, filename='shopping_list.pdf')
+def render_txt(ingredients):
+    '''Render shopping list as plain text line by line.'''
+    yield 'Список покупок\n\n'.encode()
+    for ingredient in ingredients:
+        name = ingredient['ingredient__name']
+        measure = ingredient['ingredient__measurement_unit']
+        amount = ingredient['amount']
+        yield f'{name} ({measure}) — {amount}\n'.encode()
+
+
+def render_csv(ingredients):
+    '''Render shopping list as CSV row by row.'''
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line.encode()
+
+    writer.writerow(('name', 'measurement_unit', 'amount'))
+    yield flush()
+    for ingredient in ingredients:
+        writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['amount'],
+        ))
+        yield flush()
+
+
+EXPORT_FORMATS = {
+    'pdf': (render_pdf, 'application/pdf'),
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+}
+
+
+def cache_chunks(key, chunks):
+    '''Pass rendered chunks through and cache the whole file at the end.'''
+    content = []
+    for chunk in chunks:
+        content.append(chunk)
+        yield chunk
+    cache.set(key, b''.join(content), settings.SHOPPING_LIST_CACHE_TIMEOUT)
+
+
+def export_shopping_list(user, file_format):
+    '''Build shopping list file response, reusing unchanged cached files.'''
+    render, content_type = EXPORT_FORMATS[file_format]
+    filename = f'shopping_list.{file_format}'
+    key = f'shopping_list:{user.id}:{get_cart_version(user)}:{file_format}'
+    content = cache.get(key)
+    if content is not None:
+        return FileResponse(
+            BytesIO(content), as_attachment=True,
+            filename=filename, content_type=content_type
+        )
+
+    chunks = cache_chunks(key, render(get_shopping_list(user).iterator()))
+    if file_format == 'pdf':
+        return FileResponse(
+            BytesIO(b''.join(chunks)), as_attachment=True,
+            filename=filename, content_type=content_type
+        )
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
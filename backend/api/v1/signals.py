@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import (invalidate_model, invalidate_user_state,
+                    purge_surrogate_keys)
+from recipes.models import (Cart, FavoriteRecipe, Follow, Ingredient, Recipe,
+                            Tag)
+from users.models import CustomUser
+
+SURROGATE_KEY_PREFIXES = {
+    Ingredient: 'ingredient',
+    Recipe: 'recipe',
+    Tag: 'tag',
+    CustomUser: 'user',
+}
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_catalogue(sender, **kwargs):
+    '''Drop cached ingredient/tag responses on any change.'''
+    transaction.on_commit(lambda: invalidate_model(sender))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def purge_anonymous_responses(sender, instance, **kwargs):
+    '''Purge cached anonymous recipe responses containing the object.'''
+    keys = [f'{SURROGATE_KEY_PREFIXES[sender]}-{instance.pk}']
+    if sender is Recipe:
+        keys.append('recipes')
+    transaction.on_commit(lambda: purge_surrogate_keys(*keys))
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+@receiver(post_delete, sender=FavoriteRecipe)
+@receiver(post_save, sender=Cart)
+@receiver(post_delete, sender=Cart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_user_relations(sender, instance, **kwargs):
+    '''Outdate cached state of user on any change, cascades included.'''
+    user_id = instance.user_id
+    transaction.on_commit(lambda: invalidate_user_state(user_id))
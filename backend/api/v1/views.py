@@ -1,43 +1,80 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, F, Prefetch, Value
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status, views, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 
-from .filters import IngredientFilter, RecipeFilter
-from .mixins import CreateDeleteObjMixin
-from .paginators import LimitPageNumberPagination
+from .filters import IngredientFilter, RecipeFilter, RecipeSearchFilter
+from .indexes import ingredient_index
+from .cache import invalidate_model, purge_surrogate_keys
+from .mixins import (BulkObjMixin, CachedReadOnlyMixin, CreateDeleteObjMixin,
+                     SharedRecipeCacheMixin, insert_unique)
+from .paginators import (LimitPageNumberPagination, RecipePagination,
+                         SubscriptionPagination)
 from .permissions import IsAuthorOrReadOnly
+from .renderers import CSVRenderer, NDJSONRenderer, PDFRenderer, TextRenderer
 from .serializers import (CartSerializer, FavoriteRecipeSerializer, Follow,
                           FollowSerializer, IngredientSerializer,
-                          RecipeSerializer, ShowRecipeSerializer,
-                          TagSerializer, UserRecipesSerializer)
-from .services import create_pdf
-from recipes.models import Cart, FavoriteRecipe, Ingredient, Recipe, Tag
+                          CookableRecipeSerializer, RecipeSerializer,
+                          ShoppingListItemSerializer,
+                          ShowRecipeSerializer, TagSerializer,
+                          UserRecipesSerializer)
+from .services import export_shopping_list
+from recipes.counters import change_counter
+from recipes.exporters import export_recipes
+from recipes.importers import RecipeLoader, import_records, read_ndjson
+from recipes.indexing import recipe_changed
+from recipes.matching import ingredient_recipe_index
+from recipes.models import (Cart, FavoriteRecipe, Ingredient, Recipe,
+                            ShoppingListItem, Tag, get_recipe_amounts)
+from recipes.timelines import Timeline, backfill, feed_condition, prune
 from users.models import CustomUser
 
+# Filtered, cursor paginated or estimated feeds are read by a joined query
+FEED_TIMELINE_PARAMS = {'page', 'limit'}
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(CachedReadOnlyMixin, viewsets.ReadOnlyModelViewSet):
     '''Base ingredient list viewset.'''
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [DjangoFilterBackend, ]
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('name'):
+            return self.get_cached_response(
+                self.search, request, *args, **kwargs
+            )
+        return super().list(request, *args, **kwargs)
+
+    def search(self, request, *args, **kwargs):
+        '''Answer name autocomplete from in-memory index.'''
+        return Response(
+            ingredient_index.search(request.query_params['name'])
+        )
+
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CachedReadOnlyMixin, viewsets.ReadOnlyModelViewSet):
     ''''Base tag list viewset.'''
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class RecipeViewSet(CreateDeleteObjMixin, viewsets.ModelViewSet):
+class RecipeViewSet(SharedRecipeCacheMixin, CreateDeleteObjMixin,
+                    BulkObjMixin, viewsets.ModelViewSet):
     '''Base recipe list viewset.'''
     queryset = Recipe.objects.all()
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
     permission_classes = [IsAuthorOrReadOnly, ]
-    filter_backends = [DjangoFilterBackend, ]
+    filter_backends = [DjangoFilterBackend, RecipeSearchFilter]
     filterset_class = RecipeFilter
     http_method_names = [
         'get',
@@ -46,11 +83,27 @@ class RecipeViewSet(CreateDeleteObjMixin, viewsets.ModelViewSet):
         'delete'
     ]
 
+    def get_queryset(self):
+        '''Prefetch recipe related data for read actions.'''
+        if self.action in ('list', 'retrieve', 'feed'):
+            return Recipe.objects.for_feed(self.request.user)
+        return Recipe.objects.with_user_flags(self.request.user)
+
     def get_serializer_class(self):
-        if self.action == ('list' or 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return ShowRecipeSerializer
         return RecipeSerializer
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingListItem.objects.change_recipe(
+            instance, get_recipe_amounts(instance), {}
+        )
+        recipe_id = instance.pk
+        instance.delete()
+        change_counter(CustomUser, instance.author_id, 'recipes_count', -1)
+        transaction.on_commit(lambda: recipe_changed(recipe_id))
+
     @action(detail=True,
             methods=['post'],
             permission_classes=[IsAuthenticated, ])
@@ -69,7 +122,7 @@ class RecipeViewSet(CreateDeleteObjMixin, viewsets.ModelViewSet):
         '''Delete recipe from favorites list.'''
         error = 'Этого рецепта нет в списке избранных.'
         return self.delete_obj(
-            get_object_or_404(Recipe, pk=pk),
+            pk,
             FavoriteRecipe,
             request,
             error
@@ -93,18 +146,159 @@ class RecipeViewSet(CreateDeleteObjMixin, viewsets.ModelViewSet):
         '''Delete recipes cart relational object.'''
         error = 'Этого рецепта нет в списке покупок.'
         return self.delete_obj(
-            get_object_or_404(Recipe, pk=pk),
+            pk,
             Cart,
             request,
             error
         )
 
+    @action(detail=False, methods=['get'])
+    def cookable(self, request):
+        '''Recipes ranked by coverage with given ingredients.
+
+        Ingredient ids are passed with 'ingredients' query param, repeated
+        or comma-separated. Fully covered recipes go first.
+        '''
+        try:
+            ingredient_ids = {
+                int(value)
+                for param in request.query_params.getlist('ingredients')
+                for value in param.split(',') if value
+            }
+        except ValueError:
+            return Response(
+                {'errors': 'Некорректный список ингредиентов.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ranked = ingredient_recipe_index.match(
+            ingredient_ids, settings.SEARCH_MAX_RESULTS
+        )
+        paginator = LimitPageNumberPagination()
+        page = paginator.paginate_queryset(ranked, request, view=self)
+        if page is not None:
+            ranked = page
+        recipes = Recipe.objects.for_feed(request.user).in_bulk(
+            [recipe_id for recipe_id, _, _ in ranked]
+        )
+        results = []
+        for recipe_id, matched, missing in ranked:
+            recipe = recipes.get(recipe_id)
+            if recipe is not None:
+                recipe.matched_count = matched
+                recipe.missing_count = missing
+                results.append(recipe)
+        data = CookableRecipeSerializer(
+            results, many=True, context={'request': request}
+        ).data
+        if page is None:
+            return Response(data)
+        return paginator.get_paginated_response(data)
+
     @action(detail=False,
             methods=['get'],
             permission_classes=(IsAuthenticated,))
+    def feed(self, request):
+        '''Latest recipes of authors followed by user.'''
+        if set(request.query_params) <= FEED_TIMELINE_PARAMS:
+            queryset = Timeline(request.user, self.get_queryset())
+        else:
+            queryset = self.filter_queryset(self.get_queryset()).filter(
+                feed_condition(request.user)
+            )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(detail=False,
+            methods=['get'],
+            url_path='shopping_cart',
+            permission_classes=(IsAuthenticated,))
+    def shopping_list(self, request):
+        '''Ingredient totals of recipes in user's cart.'''
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        return Response(ShoppingListItemSerializer(items, many=True).data)
+
+    @shopping_list.mapping.post
+    def shopping_list_add(self, request):
+        '''Add recipes with ids from 'recipes' list to cart.'''
+        return self.create_objs(Cart, request)
+
+    @shopping_list.mapping.delete
+    def shopping_list_delete(self, request):
+        '''Remove listed recipes from cart or clear it without a list.'''
+        if 'recipes' not in request.data:
+            return self.clear_objs(Cart, request)
+        return self.delete_objs(Cart, request)
+
+    @action(detail=False,
+            methods=['post'],
+            url_path='favorite',
+            permission_classes=(IsAuthenticated,))
+    def favorites(self, request):
+        '''Add recipes with ids from 'recipes' list to favorites.'''
+        return self.create_objs(FavoriteRecipe, request)
+
+    @favorites.mapping.delete
+    def favorites_delete(self, request):
+        '''Remove recipes with ids from 'recipes' list from favorites.'''
+        return self.delete_objs(FavoriteRecipe, request)
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(PDFRenderer, TextRenderer, CSVRenderer))
     def download_shopping_cart(self, request):
-        '''Download ingredient list from cart's recipes.'''
-        return create_pdf(request)
+        '''Download ingredient list from cart's recipes.
+
+        File format is chosen with 'format' query param: pdf, txt or csv.
+        '''
+        return export_shopping_list(
+            request.user, request.accepted_renderer.format
+        )
+
+    @action(detail=False,
+            methods=['get'],
+            permission_classes=(IsAdminUser,),
+            renderer_classes=(NDJSONRenderer,))
+    def export(self, request):
+        '''Stream filtered recipes as NDJSON accepted by recipe import.'''
+        return StreamingHttpResponse(
+            export_recipes(self.filter_queryset(self.get_queryset())),
+            content_type=NDJSONRenderer.media_type
+        )
+
+    @action(detail=False,
+            methods=['post'],
+            url_path='import',
+            permission_classes=(IsAdminUser,))
+    def import_recipes(self, request):
+        '''Load NDJSON recipes from request body by batches.
+
+        Every batch is loaded in its own transaction, invalid records are
+        reported and skipped without aborting their batch.
+        '''
+        stream = request.stream
+        result = import_records(
+            RecipeLoader(),
+            read_ndjson(iter(stream.readline, b'') if stream else ()),
+            settings.RECIPE_IMPORT_BATCH_SIZE
+        )
+        if result.created:
+            purge_surrogate_keys('recipes')
+        if result.created_ingredients:
+            transaction.on_commit(lambda: invalidate_model(Ingredient))
+        return Response({
+            'processed': result.processed,
+            'created': result.created,
+            'errors': [
+                {'record': number, 'error': message}
+                for number, message in result.errors
+            ],
+        })
 
 
 class FollowUserView(views.APIView):
@@ -113,20 +307,36 @@ class FollowUserView(views.APIView):
 
     def post(self, request, user_id):
         following = get_object_or_404(CustomUser, id=user_id)
-        serializer = FollowSerializer(
-            data={'user': request.user.id,
-                  'following': following.id},
-            context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        if following == request.user:
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    'Нельзя подписаться на самого себя.'
+                ]
+            })
+        follow = Follow(user=request.user, following=following)
+        with transaction.atomic():
+            insert_unique(follow, FollowSerializer)
+            change_counter(CustomUser, following.id, 'followers_count', 1)
+            following.refresh_from_db(fields=('followers_count',))
+            backfill(request.user, following)
+        return Response(
+            FollowSerializer(follow, context={'request': request}).data,
+            status=status.HTTP_201_CREATED
+        )
 
     def delete(self, request, user_id):
-        following = get_object_or_404(CustomUser, pk=user_id)
-        if Follow.objects.filter(
-                user=request.user, following=following).exists():
-            Follow.objects.get(user=request.user, following=following).delete()
+        with transaction.atomic():
+            deleted, _ = Follow.objects.filter(
+                user=request.user, following_id=user_id
+            ).delete()
+            if deleted:
+                change_counter(
+                    CustomUser, user_id, 'followers_count', -deleted
+                )
+                prune(request.user, user_id)
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(CustomUser, pk=user_id)
         return Response(
             {'error': 'Вы не подписаны на профиль этого пользователя', },
             status=status.HTTP_400_BAD_REQUEST)
@@ -135,10 +345,24 @@ class FollowUserView(views.APIView):
 class FollowListApiView(generics.ListAPIView):
     '''APIView for getting user's follow objects.'''
     serializer_class = UserRecipesSerializer
-    pagination_class = LimitPageNumberPagination
+    pagination_class = SubscriptionPagination
     permission_classes = [IsAuthenticated, ]
 
     def get_queryset(self):
-        qs = CustomUser.objects.filter(
-            subscriptions__user=self.request.user).prefetch_related('author')
-        return qs
+        user = self.request.user
+        recipes = Recipe.objects.filter(
+            author__in=Follow.objects.filter(user=user).values('following')
+        )
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes.latest_per_author(int(recipes_limit))
+        return CustomUser.objects.filter(
+            subscriptions__user=user
+        ).annotate(
+            follow_id=F('subscriptions__id'),
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by(
+            '-follow_id'
+        ).prefetch_related(
+            Prefetch('author', queryset=recipes, to_attr='recipe_previews')
+        )
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.v1.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +95,38 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_cache')),
+    }
+}
+
+CATALOGUE_CACHE_TIMEOUT = int(os.getenv('CATALOGUE_CACHE_TIMEOUT',
+                                        default=60 * 60 * 24))
+
+SHOPPING_LIST_CACHE_TIMEOUT = int(os.getenv('SHOPPING_LIST_CACHE_TIMEOUT',
+                                            default=60 * 60))
+
+# Anonymous recipe responses are purged on change, lists also expire as
+# popularity orderings change without recipe writes
+ANONYMOUS_CACHE_TIMEOUT = int(os.getenv('ANONYMOUS_CACHE_TIMEOUT',
+                                        default=60 * 60 * 24))
+ANONYMOUS_LIST_CACHE_TIMEOUT = int(os.getenv('ANONYMOUS_LIST_CACHE_TIMEOUT',
+                                             default=60))
+# Shared caches (nginx) can't be purged and keep responses only briefly
+ANONYMOUS_SHARED_CACHE_MAX_AGE = int(
+    os.getenv('ANONYMOUS_SHARED_CACHE_MAX_AGE', default=10)
+)
+
+# Favorite, cart and following id sets of users, changed in place by API
+USER_STATE_CACHE_TIMEOUT = int(os.getenv('USER_STATE_CACHE_TIMEOUT',
+                                         default=60 * 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -121,6 +155,61 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Result limit of in-process recipe search and ingredient matching
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', default=1000))
+
+# Tables with more rows use planner estimates for 'count=estimate' pages
+PAGINATION_ESTIMATE_THRESHOLD = int(os.getenv(
+    'PAGINATION_ESTIMATE_THRESHOLD', default=100000))
+
+# Trending score decay, events older than the window are ignored
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS',
+                                           default=48))
+TRENDING_WINDOW_HALF_LIVES = 10
+
+# Recipe ids limit of bulk cart and favorites requests
+BULK_RECIPES_MAX = 100
+
+# Recipes loaded in one transaction by recipe import endpoint
+RECIPE_IMPORT_BATCH_SIZE = 500
+
+# Recipes of authors with more followers are not copied to timelines
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS',
+                                          default=5000))
+# Recipes of newly followed author added to timeline
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', default=50))
+
+# Requests with more queries are logged with duplicate query stacks
+REQUEST_METRICS_QUERY_THRESHOLD = int(os.getenv(
+    'REQUEST_METRICS_QUERY_THRESHOLD', default=30))
+# Share of requests which metrics are passed to the sink
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv(
+    'REQUEST_METRICS_SAMPLE_RATE', default=0))
+REQUEST_METRICS_SINK = os.getenv('REQUEST_METRICS_SINK',
+                                 default='api.v1.metrics.log_sink')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.metrics': {
+            'handlers': ['console'],
+            'level': os.getenv('METRICS_LOG_LEVEL', default='INFO'),
+            'propagate': False,
+        },
+        'recipes.images': {
+            'handlers': ['console'],
+            'level': 'ERROR',
+            'propagate': False,
+        },
+    },
+}
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -159,6 +248,19 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'backend_static/')
 
 MEDIA_URL = '/backend_media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'backend_media/')
+
+# Uploaded recipe images and their resized copies
+IMAGE_MAX_SIZE = int(os.getenv('IMAGE_MAX_SIZE', default=10 * 1024 * 1024))
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', default=8000))
+IMAGE_RENDITIONS = {
+    'thumbnail': (160, 160),
+    'card': (480, 480),
+    'full': (1280, 1280),
+}
+IMAGE_QUALITY = 85
+IMAGE_WORKER_BACKEND = os.getenv('IMAGE_WORKER_BACKEND',
+                                 default='recipes.images.ThreadPoolBackend')
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -2,8 +2,11 @@ from django.conf import settings
 from django.contrib.admin import ModelAdmin, TabularInline, register
 from django.forms import models, ValidationError
 
+from .counters import reconcile_recipe_counters, reconcile_user_counters
+from .images import schedule_renditions
+from .indexing import recipe_changed
 from .models import (Cart, FavoriteRecipe, Ingredient, Recipe,
-                     RecipeIngredient, Tag)
+                     RecipeIngredient, ShoppingListItem, Tag)
 
 
 @register(Ingredient)
@@ -64,8 +67,31 @@ class RecipeAdmin(ModelAdmin):
     empty_value_display = settings.EMPTY_VALUE
     inlines = [RecipeIngredientInline, ]
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if 'image' in form.changed_data:
+            schedule_renditions(obj)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.objects.rebuild(
+            form.instance.cart.values_list('user_id', flat=True)
+        )
+        reconcile_user_counters(
+            {form.instance.author_id, form.initial.get('author')} - {None}
+        )
+        recipe_changed(form.instance.pk)
+
+    def delete_model(self, request, obj):
+        user_ids = list(obj.cart.values_list('user_id', flat=True))
+        recipe_id = obj.pk
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.rebuild(user_ids)
+        reconcile_user_counters([obj.author_id])
+        recipe_changed(recipe_id)
+
     def favorites_amount(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     def ingredient(self, obj):
         return (
@@ -87,9 +113,41 @@ class FavoriteAdmin(ModelAdmin):
     search_fields = ('user', 'recipe')
     empty_value_display = settings.EMPTY_VALUE
 
+    def save_model(self, request, obj, form, change):
+        recipe_ids = {obj.recipe_id}
+        if change:
+            recipe_ids.add(form.initial['recipe'])
+        super().save_model(request, obj, form, change)
+        reconcile_recipe_counters(recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        reconcile_recipe_counters([obj.recipe_id])
+
 
 @register(Cart)
 class CartAdmin(ModelAdmin):
     list_display = ('pk', 'user', 'recipe')
     search_fields = ('user', 'recipe')
     empty_value_display = settings.EMPTY_VALUE
+
+    def save_model(self, request, obj, form, change):
+        user_ids, recipe_ids = {obj.user_id}, {obj.recipe_id}
+        if change:
+            user_ids.add(form.initial['user'])
+            recipe_ids.add(form.initial['recipe'])
+        super().save_model(request, obj, form, change)
+        ShoppingListItem.objects.rebuild(user_ids)
+        reconcile_recipe_counters(recipe_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        ShoppingListItem.objects.rebuild([obj.user_id])
+        reconcile_recipe_counters([obj.recipe_id])
+
+
+@register(ShoppingListItem)
+class ShoppingListItemAdmin(ModelAdmin):
+    list_display = ('pk', 'user', 'ingredient', 'total_amount')
+    search_fields = ('user__username', 'ingredient__name')
+    empty_value_display = settings.EMPTY_VALUE
@@ -0,0 +1,76 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Cart, FavoriteRecipe, Follow, Recipe
+from users.models import CustomUser
+
+RECIPE_COUNTERS = {
+    'favorites_count': (FavoriteRecipe, 'recipe'),
+    'cart_count': (Cart, 'recipe'),
+}
+USER_COUNTERS = {
+    'recipes_count': (Recipe, 'author'),
+    'followers_count': (Follow, 'following'),
+}
+COUNTER_FIELDS = {
+    related: field for field, (related, _) in RECIPE_COUNTERS.items()
+}
+
+
+def shifted(field, delta):
+    # Drifted counter must not break a write by going below zero
+    if delta < 0:
+        return Greatest(F(field) + delta, 0)
+    return F(field) + delta
+
+
+def change_counter(model, pk, field, delta):
+    '''Atomically shift counter column of a single row.'''
+    if delta:
+        model.objects.filter(pk=pk).update(**{field: shifted(field, delta)})
+
+
+def change_counters(model, pks, field, delta):
+    '''Atomically shift counter column of several rows.'''
+    if delta and pks:
+        model.objects.filter(pk__in=pks).update(
+            **{field: shifted(field, delta)}
+        )
+
+
+def count_related(related, lookup):
+    return Coalesce(
+        Subquery(
+            related.objects.filter(**{lookup: OuterRef('pk')})
+            .order_by().values(lookup)
+            .annotate(total=Count('pk')).values('total')
+        ),
+        0
+    )
+
+
+def reconcile_counters(model, counters, pks=None):
+    '''Fix counter columns differing from amount of related rows.'''
+    queryset = model.objects.all()
+    if pks is not None:
+        queryset = queryset.filter(pk__in=list(pks))
+    fixed = {}
+    for field, (related, lookup) in counters.items():
+        wrong = queryset.annotate(
+            actual=count_related(related, lookup)
+        ).exclude(**{field: F('actual')})
+        rows = [
+            model(pk=pk, **{field: actual})
+            for pk, actual in wrong.values_list('pk', 'actual')
+        ]
+        model.objects.bulk_update(rows, (field,), batch_size=1000)
+        fixed[field] = len(rows)
+    return fixed
+
+
+def reconcile_recipe_counters(recipe_ids=None):
+    return reconcile_counters(Recipe, RECIPE_COUNTERS, recipe_ids)
+
+
+def reconcile_user_counters(user_ids=None):
+    return reconcile_counters(CustomUser, USER_COUNTERS, user_ids)
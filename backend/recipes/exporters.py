@@ -0,0 +1,49 @@
+import json
+from collections import defaultdict
+
+from .importers import batches
+from .models import Recipe, RecipeIngredient
+
+EXPORT_CHUNK_SIZE = 500
+
+
+def export_recipes(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    '''Yield recipes as NDJSON lines in the format of RecipeLoader.
+
+    Recipes are read with a server-side cursor and their ingredients and
+    tags are fetched by chunks, so memory use does not grow with export.
+    '''
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    recipes = queryset.order_by('id').values(
+        'id', 'author__username', 'name', 'text', 'cooking_time', 'image'
+    ).iterator(chunk_size=chunk_size)
+    for chunk in batches(recipes, chunk_size):
+        recipe_ids = [recipe['id'] for recipe in chunk]
+        ingredients, tags = defaultdict(list), defaultdict(list)
+        for recipe_id, name, measurement_unit, amount in (
+            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+            .order_by('id').values_list(
+                'recipe_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount'
+            )
+        ):
+            ingredients[recipe_id].append({
+                'name': name,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            })
+        for recipe_id, slug in Recipe.tags.through.objects.filter(
+            recipe_id__in=recipe_ids
+        ).order_by('id').values_list('recipe_id', 'tag__slug'):
+            tags[recipe_id].append(slug)
+        for recipe in chunk:
+            yield json.dumps({
+                'author': recipe['author__username'],
+                'name': recipe['name'],
+                'text': recipe['text'],
+                'cooking_time': recipe['cooking_time'],
+                'image': recipe['image'],
+                'tags': tags[recipe['id']],
+                'ingredients': ingredients[recipe['id']],
+            }, ensure_ascii=False) + '\n'
@@ -0,0 +1,110 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils.module_loading import import_string
+from PIL import Image
+
+logger = logging.getLogger('recipes.images')
+
+RENDITION_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+
+class SyncBackend:
+    '''Worker backend running tasks right away in the calling thread.'''
+
+    def submit(self, func, *args):
+        func(*args)
+
+
+class ThreadPoolBackend:
+    '''Worker backend running tasks in an in-process thread pool.'''
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='renditions'
+        )
+
+    def submit(self, func, *args):
+        self.executor.submit(self.run, func, *args)
+
+    def run(self, func, *args):
+        close_old_connections()
+        try:
+            func(*args)
+        except Exception:
+            # Result of the pool future is never read, so report it here
+            logger.exception('Background task %s failed', func.__name__)
+        finally:
+            close_old_connections()
+
+
+@lru_cache(maxsize=None)
+def get_backend():
+    return import_string(settings.IMAGE_WORKER_BACKEND)()
+
+
+def get_rendition_path(image_name, rendition, extension):
+    directory, filename = os.path.split(image_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(
+        directory, 'renditions', f'{stem}_{rendition}.{extension}'
+    )
+
+
+def build_renditions(recipe_id, image_name):
+    '''Save resized copies of recipe image and store their paths.'''
+    from .models import Recipe
+
+    with default_storage.open(image_name) as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    renditions = {}
+    for rendition, size in settings.IMAGE_RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        renditions[rendition] = {}
+        for extension, image_format in RENDITION_FORMATS.items():
+            converted = resized
+            if image_format == 'JPEG' and resized.mode != 'RGB':
+                converted = resized.convert('RGB')
+            buffer = BytesIO()
+            converted.save(
+                buffer, image_format, quality=settings.IMAGE_QUALITY
+            )
+            path = get_rendition_path(image_name, rendition, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            renditions[rendition][extension] = default_storage.save(
+                path, ContentFile(buffer.getvalue())
+            )
+
+    # Saved through the model so that post_save receivers see the change
+    with transaction.atomic():
+        recipe = Recipe.objects.select_for_update().filter(
+            pk=recipe_id, image=image_name
+        ).first()
+        if recipe is not None:
+            recipe.image_renditions = renditions
+            recipe.save(update_fields=['image_renditions'])
+
+
+def schedule_renditions(recipe):
+    '''Build renditions in background once the recipe is committed.'''
+    recipe_id, image_name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: get_backend().submit(build_renditions, recipe_id, image_name)
+    )
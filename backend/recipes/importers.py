@@ -0,0 +1,432 @@
+import csv
+import io
+import json
+from functools import partial
+from itertools import islice
+
+from django.db import connection, transaction
+
+from .counters import reconcile_user_counters
+from .matching import bump_version
+from .models import Ingredient, Recipe, RecipeIngredient, Tag
+from .search import update_search_vectors
+from .timelines import fan_out
+from users.models import CustomUser
+
+JSON_CHUNK_SIZE = 64 * 1024
+NAME_MAX_LENGTH = 200
+SMALL_INTEGER_MAX = 32767
+
+
+def read_csv(file, fieldnames=None):
+    for record in csv.DictReader(file, fieldnames=fieldnames):
+        # Header row of a file read with explicit fieldnames
+        if fieldnames and list(record.values()) == list(fieldnames):
+            continue
+        yield record
+
+
+def read_ndjson(file):
+    '''Read JSON lines, yielding None for lines which can't be decoded.'''
+    for line in file:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def skip_separators(buffer, position):
+    while position < len(buffer) and buffer[position] in ' \t\r\n,':
+        position += 1
+    return position
+
+
+def read_json(file):
+    '''Read items of top-level JSON array without loading it at once.'''
+    decoder = json.JSONDecoder()
+    buffer = file.read(JSON_CHUNK_SIZE)
+    position = skip_separators(buffer, 0)
+    if not buffer[position:position + 1] == '[':
+        raise ValueError('JSON data should be an array.')
+    buffer = buffer[position + 1:]
+    while True:
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer += chunk
+        position = skip_separators(buffer, 0)
+        while buffer[position:position + 1] not in ('', ']'):
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise
+                break
+            yield item
+            position = skip_separators(buffer, position)
+        if buffer[position:position + 1] == ']' or not chunk:
+            return
+        buffer = buffer[position:]
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'ndjson': read_ndjson,
+}
+
+
+def batches(records, size):
+    records = iter(records)
+    while True:
+        batch = list(islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+class ImportResult:
+    '''Counters of processed records and errors of a single import.'''
+
+    def __init__(self):
+        self.processed = 0
+        self.created = 0
+        self.updated = 0
+        self.created_ingredients = 0
+        self.errors = []
+
+    def error(self, number, message):
+        self.errors.append((number, message))
+
+
+class IngredientLoader:
+    '''Insert ingredients skipping already existing ones.'''
+    model = Ingredient
+    # Ingredient CSV files of the project have no header row
+    csv_fields = ('name', 'measurement_unit')
+
+    def load(self, batch, result):
+        ingredients = []
+        for number, record in batch:
+            name = (record.get('name') or '').strip()
+            measurement_unit = (record.get('measurement_unit') or '').strip()
+            if not name or not measurement_unit:
+                result.error(number, 'Не указано название или единица.')
+                continue
+            ingredients.append(Ingredient(
+                name=name, measurement_unit=measurement_unit
+            ))
+        Ingredient.objects.bulk_create(ingredients, ignore_conflicts=True)
+
+    copy_columns = ('name', 'measurement_unit')
+    copy_insert_sql = (
+        'INSERT INTO recipes_ingredient (name, measurement_unit) '
+        'SELECT DISTINCT trim(name), trim(measurement_unit) FROM {staging} '
+        'ON CONFLICT (name, measurement_unit) DO NOTHING'
+    )
+
+
+class TagLoader:
+    '''Insert tags or update name and color of existing slugs.'''
+    model = Tag
+
+    def load(self, batch, result):
+        tags = {}
+        for number, record in batch:
+            if not all(map(record.get, ('name', 'color', 'slug'))):
+                result.error(number, 'Не указаны название, цвет или слаг.')
+                continue
+            tags[record['slug']] = Tag(
+                name=record['name'], color=record['color'], slug=record['slug']
+            )
+        existing = Tag.objects.in_bulk(tags, field_name='slug')
+        changed = []
+        for slug, tag in existing.items():
+            new = tags.pop(slug)
+            if (tag.name, tag.color) != (new.name, new.color):
+                tag.name, tag.color = new.name, new.color
+                changed.append(tag)
+        Tag.objects.bulk_update(changed, ('name', 'color'))
+        Tag.objects.bulk_create(tags.values(), ignore_conflicts=True)
+        result.updated += len(changed)
+
+    copy_columns = ('name', 'color', 'slug')
+    copy_insert_sql = (
+        'INSERT INTO recipes_tag (name, color, slug) '
+        'SELECT DISTINCT ON (slug) name, color, slug FROM {staging} '
+        'ON CONFLICT (slug) DO UPDATE '
+        'SET name = EXCLUDED.name, color = EXCLUDED.color'
+    )
+
+
+class UserLoader:
+    '''Insert users with unusable passwords skipping existing ones.'''
+    model = CustomUser
+
+    def load(self, batch, result):
+        users = []
+        for number, record in batch:
+            if not record.get('username') or not record.get('email'):
+                result.error(number, 'Не указаны имя пользователя или почта.')
+                continue
+            user = CustomUser(
+                username=record['username'],
+                email=record['email'],
+                first_name=record.get('first_name', ''),
+                last_name=record.get('last_name', ''),
+            )
+            user.set_unusable_password()
+            users.append(user)
+        CustomUser.objects.bulk_create(users, ignore_conflicts=True)
+
+
+class RecipeLoader:
+    '''Insert recipes with tags and ingredients in bulk.
+
+    Record fields: author (username), name, text, cooking_time, image,
+    tags (slugs) and ingredients ({name, measurement_unit, amount}).
+    Recipes with the same author and name are skipped, unknown ingredients
+    are created.
+    '''
+    model = Recipe
+
+    def load(self, batch, result):
+        checked = []
+        for number, record in batch:
+            error = self.validate(record)
+            if error:
+                result.error(number, error)
+            else:
+                checked.append((number, record))
+        authors = CustomUser.objects.in_bulk(
+            {record['author'] for _, record in checked},
+            field_name='username'
+        )
+        tags = Tag.objects.in_bulk(
+            {
+                slug for _, record in checked
+                for slug in (record.get('tags') or ())
+            },
+            field_name='slug'
+        )
+        valid = []
+        for number, record in checked:
+            error = self.validate_relations(record, authors, tags)
+            if error:
+                result.error(number, error)
+            else:
+                valid.append(record)
+        existing = set(Recipe.objects.filter(
+            author__in=authors.values(),
+            name__in={record['name'] for record in valid}
+        ).values_list('author_id', 'name'))
+
+        recipes = {}
+        for record in valid:
+            author = authors[record['author']]
+            key = (author.id, record['name'])
+            if key in existing or key in recipes:
+                continue
+            recipes[key] = (
+                Recipe(
+                    author=author,
+                    name=record['name'],
+                    text=record['text'],
+                    cooking_time=record['cooking_time'],
+                    image=record.get('image', ''),
+                ),
+                record
+            )
+        if not recipes:
+            return
+        # Ingredients are created only for recipes which are inserted
+        ingredients = self.get_ingredients(
+            [record for _, record in recipes.values()], result
+        )
+        Recipe.objects.bulk_create(recipe for recipe, _ in recipes.values())
+        ids = {
+            (author_id, name): pk for pk, author_id, name in
+            Recipe.objects.filter(
+                author_id__in={author_id for author_id, _ in recipes},
+                name__in={name for _, name in recipes}
+            ).values_list('id', 'author_id', 'name')
+        }
+        recipe_ingredients, recipe_tags = [], []
+        for key, (_, record) in recipes.items():
+            recipe_id = ids[key]
+            amounts = {}
+            for item in record['ingredients']:
+                ingredient = ingredients[
+                    (item['name'], item['measurement_unit'])
+                ]
+                amounts[ingredient.id] = (
+                    amounts.get(ingredient.id, 0) + int(item['amount'])
+                )
+            recipe_ingredients.extend(
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=amount
+                )
+                for ingredient_id, amount in amounts.items()
+            )
+            recipe_tags.extend(
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag.id)
+                for tag in {tags[slug] for slug in (record.get('tags') or ())}
+            )
+        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        Recipe.tags.through.objects.bulk_create(recipe_tags)
+        reconcile_user_counters({author_id for author_id, _ in recipes})
+        fan_out(ids.values())
+        transaction.on_commit(
+            partial(update_search_vectors, list(ids.values()))
+        )
+        transaction.on_commit(bump_version)
+        result.created += len(recipes)
+
+    def get_ingredients(self, records, result):
+        '''Get ingredients by (name, unit), creating unknown ones.'''
+        keys = {
+            (item['name'], item['measurement_unit'])
+            for record in records
+            for item in record['ingredients']
+        }
+        ingredients = self.find_ingredients(keys)
+        missing = keys - set(ingredients)
+        if not missing:
+            return ingredients
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in missing
+            ),
+            ignore_conflicts=True
+        )
+        result.created_ingredients += len(missing)
+        return self.find_ingredients(keys)
+
+    def find_ingredients(self, keys):
+        return {
+            (ingredient.name, ingredient.measurement_unit): ingredient
+            for ingredient in Ingredient.objects.filter(
+                name__in={name for name, _ in keys}
+            )
+        }
+
+    def validate(self, record):
+        '''Check record fields before any lookup by them.'''
+        if not record.get('author') or not isinstance(record['author'], str):
+            return 'Не указан автор.'
+        name, text = record.get('name'), record.get('text')
+        if not name or not text or not isinstance(name, str) or not (
+            isinstance(text, str)
+        ):
+            return 'Не указано название или текст рецепта.'
+        if len(name) > NAME_MAX_LENGTH:
+            return 'Слишком длинное название рецепта.'
+        if not isinstance(record.get('image', ''), str):
+            return 'Некорректное изображение.'
+        try:
+            if not 1 <= int(record.get('cooking_time')) <= SMALL_INTEGER_MAX:
+                return 'Введено некорректное время приготовления.'
+        except (TypeError, ValueError):
+            return 'Введено некорректное время приготовления.'
+        slugs = record.get('tags') or []
+        if not isinstance(slugs, list) or not all(
+            isinstance(slug, str) for slug in slugs
+        ):
+            return 'Некорректный список тегов.'
+        items = record.get('ingredients')
+        if not items or not isinstance(items, list):
+            return 'Не указаны ингредиенты.'
+        return next(filter(None, map(self.validate_ingredient, items)), None)
+
+    def validate_relations(self, record, authors, tags):
+        if record['author'] not in authors:
+            return 'Автор не найден.'
+        unknown_tags = set(record.get('tags') or ()) - set(tags)
+        if unknown_tags:
+            return f'Теги не найдены: {", ".join(sorted(unknown_tags))}.'
+        return None
+
+    def validate_ingredient(self, item):
+        try:
+            if not item['name'] or not item['measurement_unit']:
+                return 'Не указано название или единица ингредиента.'
+            if not isinstance(item['name'], str) or not isinstance(
+                item['measurement_unit'], str
+            ):
+                return 'Некорректный ингредиент.'
+            if max(map(len, (item['name'], item['measurement_unit']))) > (
+                NAME_MAX_LENGTH
+            ):
+                return 'Слишком длинное название или единица ингредиента.'
+            if int(item['amount']) < 1:
+                return 'Количество не может быть меньше 1.'
+            if int(item['amount']) > SMALL_INTEGER_MAX:
+                return 'Слишком большое количество.'
+        except (KeyError, TypeError, ValueError):
+            return 'Некорректный ингредиент.'
+        return None
+
+
+LOADERS = {
+    'ingredients': IngredientLoader,
+    'tags': TagLoader,
+    'users': UserLoader,
+    'recipes': RecipeLoader,
+}
+
+
+def import_records(loader, records, batch_size, dry_run=False,
+                   progress=None):
+    '''Load records by batches, each one in its own transaction.'''
+    result = ImportResult()
+    for batch in batches(records, batch_size):
+        valid = []
+        for number, record in enumerate(batch, result.processed + 1):
+            if isinstance(record, dict):
+                valid.append((number, record))
+            else:
+                result.error(number, 'Некорректная запись.')
+        with transaction.atomic():
+            loader.load(valid, result)
+            if dry_run:
+                transaction.set_rollback(True)
+        result.processed += len(batch)
+        if progress:
+            progress(result)
+    return result
+
+
+def copy_csv(loader, file, fieldnames=None, dry_run=False):
+    '''Load CSV file with COPY into staging table (PostgreSQL only).'''
+    header = next(csv.reader([file.readline()]), [])
+    if fieldnames and header != list(fieldnames):
+        file.seek(0)
+    columns = fieldnames or header
+    if sorted(columns) != sorted(loader.copy_columns):
+        raise ValueError(
+            f'CSV columns should be: {", ".join(loader.copy_columns)}.'
+        )
+    staging = f'{loader.model._meta.db_table}_staging'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMP TABLE {staging} '
+            f'({", ".join(f"{column} text" for column in columns)}) '
+            'ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            f'COPY {staging} ({", ".join(columns)}) '
+            'FROM STDIN WITH (FORMAT csv)',
+            file
+        )
+        cursor.execute(f'SELECT count(*) FROM {staging}')
+        processed = cursor.fetchone()[0]
+        cursor.execute(loader.copy_insert_sql.format(staging=staging))
+        if dry_run:
+            transaction.set_rollback(True)
+    return processed
+
+
+def open_text(path, mode='r'):
+    return io.open(path, mode, encoding='utf-8', newline='')
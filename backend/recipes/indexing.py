@@ -0,0 +1,8 @@
+from .matching import ingredient_recipe_index
+from .search import update_search_vectors
+
+
+def recipe_changed(recipe_id):
+    '''Refresh derived recipe indexes after recipe is saved or deleted.'''
+    update_search_vectors([recipe_id])
+    ingredient_recipe_index.update(recipe_id)
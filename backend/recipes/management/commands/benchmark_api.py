@@ -0,0 +1,166 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from itertools import cycle
+
+import django
+from django.core.cache import cache
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Follow, Ingredient
+from users.models import CustomUser
+
+
+def percentile(values, percent):
+    '''Nearest-rank percentile of sorted values.'''
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark API endpoints in-process and report JSON statistics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--memory-requests', type=int, default=5,
+            help='Requests traced with tracemalloc to find peak memory'
+        )
+        parser.add_argument(
+            '--user',
+            help='Username of requesting user, the one with most '
+                 'subscriptions by default'
+        )
+        parser.add_argument(
+            '--endpoints', nargs='+',
+            choices=('recipes', 'subscriptions', 'ingredients', 'download'),
+            default=('recipes', 'subscriptions', 'ingredients', 'download')
+        )
+        parser.add_argument(
+            '--cold-cache', action='store_true',
+            help='Clear cache before each request'
+        )
+        parser.add_argument('--output', help='JSON file for results')
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(
+            HTTP_AUTHORIZATION=f'Token {token.key}', SERVER_NAME='localhost'
+        )
+        results = {
+            'meta': {
+                'user': user.username,
+                'requests': options['requests'],
+                'cold_cache': options['cold_cache'],
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'endpoints': {},
+        }
+        for name in options['endpoints']:
+            paths = getattr(self, f'{name}_paths')()
+            results['endpoints'][name] = self.run(
+                name, client, paths, options
+            )
+
+        report = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(report)
+        else:
+            self.stdout.write(report)
+
+    def get_user(self, username):
+        if username:
+            user = CustomUser.objects.filter(username=username).first()
+        else:
+            following = Follow.objects.values('user').annotate(
+                total=Count('id')
+            ).order_by('-total', 'user').first()
+            user = following and CustomUser.objects.get(pk=following['user'])
+        if user is None:
+            raise CommandError(
+                'Пользователь не найден, заполните базу seed_benchmark.'
+            )
+        return user
+
+    def recipes_paths(self):
+        return [f'/api/recipes/?page={page}&limit=6' for page in range(1, 6)]
+
+    def subscriptions_paths(self):
+        return [
+            f'/api/users/subscriptions/?page={page}&limit=6&recipes_limit=3'
+            for page in range(1, 4)
+        ]
+
+    def ingredients_paths(self):
+        names = Ingredient.objects.order_by('id').values_list(
+            'name', flat=True
+        )[:200:20]
+        return [
+            f'/api/ingredients/?name={name[:length]}'
+            for name in names for length in (1, 3)
+        ] or ['/api/ingredients/?name=а']
+
+    def download_paths(self):
+        return [
+            f'/api/recipes/download_shopping_cart/?format={fmt}'
+            for fmt in ('pdf', 'txt', 'csv')
+        ]
+
+    def request(self, client, path, cold_cache):
+        if cold_cache:
+            cache.clear()
+        response = client.get(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def run(self, name, client, paths, options):
+        paths = cycle(paths)
+        for _ in range(options['warmup']):
+            self.request(client, next(paths), options['cold_cache'])
+
+        timings, queries, errors = [], [], 0
+        for _ in range(options['requests']):
+            path = next(paths)
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                status = self.request(client, path, options['cold_cache'])
+                timings.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+            errors += status >= 400
+
+        peaks = []
+        for _ in range(options['memory_requests']):
+            tracemalloc.start()
+            self.request(client, next(paths), options['cold_cache'])
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        timings.sort()
+        result = {
+            'errors': errors,
+            'mean_ms': round(statistics.mean(timings), 3),
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'queries_mean': round(statistics.mean(queries), 2),
+            'queries_max': max(queries),
+            'peak_memory_kb': round(max(peaks, default=0) / 1024, 1),
+        }
+        self.stderr.write(
+            f'{result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+            f'{result["p99_ms"]:>9.2f} ms  {result["queries_mean"]:>6} '
+            f'queries  {name}'
+        )
+        return result
@@ -0,0 +1,64 @@
+import random
+import statistics
+import time
+
+from django.core.management import BaseCommand
+
+from api.v1.indexes import IngredientNameIndex
+from recipes.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = 'Compare ingredient autocomplete via ORM and in-memory index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queries', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        names = list(Ingredient.objects.values_list('name', flat=True))
+        if not names:
+            self.stderr.write('Нет ингредиентов для замера.')
+            return
+        rng = random.Random(options['seed'])
+        prefixes = [
+            name[:rng.randint(1, min(len(name), 4))]
+            for name in rng.choices(names, k=options['queries'])
+        ]
+        index = IngredientNameIndex()
+        started = time.perf_counter()
+        index.refresh()
+        build_time = time.perf_counter() - started
+
+        results = {
+            'orm': self.measure(
+                lambda prefix: list(
+                    Ingredient.objects.filter(
+                        name__istartswith=prefix
+                    ).values('id', 'name', 'measurement_unit')
+                ),
+                prefixes
+            ),
+            'index': self.measure(index.search, prefixes),
+        }
+        self.stdout.write(
+            f'index build: {build_time * 1000:.2f} ms, '
+            f'{len(names)} ingredients, {len(prefixes)} queries'
+        )
+        for name, timings in results.items():
+            self.stdout.write(
+                f'{name}: mean {statistics.mean(timings):.3f} ms, '
+                f'p95 {self.percentile(timings, 95):.3f} ms'
+            )
+
+    def measure(self, search, prefixes):
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            search(prefix)
+            timings.append((time.perf_counter() - started) * 1000)
+        return timings
+
+    def percentile(self, timings, percent):
+        ordered = sorted(timings)
+        return ordered[min(len(ordered) - 1, len(ordered) * percent // 100)]
@@ -0,0 +1,57 @@
+import random
+import statistics
+import time
+from array import array
+from collections import defaultdict
+
+from django.core.management import BaseCommand
+
+from recipes.matching import IngredientRecipeIndex
+
+
+class Command(BaseCommand):
+    help = 'Benchmark ingredient set matching on a synthetic corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2200)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        ingredients = range(1, options['ingredients'] + 1)
+        # Popular ingredients (salt, oil, ...) are used much more often
+        weights = [1 / rank for rank in ingredients]
+        recipes = defaultdict(set)
+        for recipe_id in range(1, options['recipes'] + 1):
+            while len(recipes[recipe_id]) < rng.randint(3, 12):
+                recipes[recipe_id].update(rng.choices(ingredients, weights))
+
+        index = IngredientRecipeIndex()
+        started = time.perf_counter()
+        postings = defaultdict(lambda: array('q'))
+        for recipe_id, recipe_ingredients in recipes.items():
+            for ingredient_id in recipe_ingredients:
+                postings[ingredient_id].append(recipe_id)
+        index.data = (dict(postings), {
+            recipe_id: len(recipe_ingredients)
+            for recipe_id, recipe_ingredients in recipes.items()
+        })
+        index.refresh = lambda: None
+        build_time = time.perf_counter() - started
+
+        timings = []
+        for _ in range(options['queries']):
+            pantry = rng.choices(ingredients, weights, k=rng.randint(5, 25))
+            started = time.perf_counter()
+            index.match(pantry, 20)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'build: {build_time:.2f} s for {len(recipes)} recipes'
+        )
+        self.stdout.write(
+            f'match: mean {statistics.mean(timings):.2f} ms, '
+            f'p95 {timings[len(timings) * 95 // 100]:.2f} ms'
+        )
@@ -0,0 +1,59 @@
+import random
+import statistics
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.models import Ingredient
+from recipes.search import InvertedIndex
+
+WORDS = (
+    'суп салат пирог запеканка каша соус рагу паста торт омлет блины '
+    'котлеты плов жаркое десерт тушеный жареный запеченный домашний '
+    'быстрый острый сладкий нежный летний зимний праздничный'
+).split()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark in-process recipe search on a synthetic corpus'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        ingredients = list(
+            Ingredient.objects.values_list('name', flat=True)[:2000]
+        ) or [f'ингредиент{number}' for number in range(2000)]
+
+        index = InvertedIndex()
+        started = time.perf_counter()
+        for recipe_id in range(1, options['recipes'] + 1):
+            index.add(
+                recipe_id,
+                ' '.join(rng.choices(WORDS, k=3)),
+                ' '.join(rng.choices(WORDS, k=30)),
+                rng.sample(ingredients, k=8)
+            )
+        build_time = time.perf_counter() - started
+
+        queries = [
+            ' '.join(rng.choices(WORDS + ingredients, k=rng.randint(1, 3)))
+            for _ in range(options['queries'])
+        ]
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query, 20)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'build: {build_time:.2f} s for {len(index)} recipes, '
+            f'{len(index.postings)} terms'
+        )
+        self.stdout.write(
+            f'search: mean {statistics.mean(timings):.2f} ms, '
+            f'p95 {timings[len(timings) * 95 // 100]:.2f} ms'
+        )
@@ -0,0 +1,42 @@
+from django.core.management import BaseCommand, CommandError
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Compare stored shopping list totals with users\' carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, nargs='*', dest='users',
+            help='Check lists of given user ids only'
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['users']
+        expected = ShoppingListItem.objects.expected_totals(user_ids)
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        stored = {
+            (user_id, ingredient_id): total
+            for user_id, ingredient_id, total in items.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            )
+        }
+        mismatches = [
+            (key, expected.get(key), stored.get(key))
+            for key in sorted({*expected, *stored})
+            if expected.get(key) != stored.get(key)
+        ]
+        for (user_id, ingredient_id), wanted, actual in mismatches:
+            self.stdout.write(
+                f'user {user_id}, ingredient {ingredient_id}: '
+                f'expected {wanted}, stored {actual}'
+            )
+        if mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {len(mismatches)}. '
+                'Запустите rebuild_shopping_lists.'
+            )
+        self.stdout.write(self.style.SUCCESS('Списки покупок согласованы.'))
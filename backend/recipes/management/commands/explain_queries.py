@@ -0,0 +1,45 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = 'Show query plans of the canonical recipe/ingredient list queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int,
+            help='User id for user-specific filters (first user by default)'
+        )
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.order_by('pk')
+        if options['user']:
+            user = user.filter(pk=options['user'])
+        user = user.first()
+        if user is None:
+            raise CommandError('Нет пользователей для построения запросов.')
+        tag = Tag.objects.first()
+        feed = Recipe.objects.with_user_flags(user)
+
+        queries = {
+            'recipe feed': feed,
+            'recipes by author': feed.filter(author=user),
+            'recipes by tag': feed.filter(
+                tags__slug=tag.slug if tag else ''
+            ),
+            'favorited recipes': feed.filter(is_favorited=True),
+            'recipes in cart': feed.filter(is_in_shopping_cart=True),
+            'ingredients by name': Ingredient.objects.filter(
+                name__istartswith='а'
+            ),
+        }
+        explain_options = {}
+        if connection.vendor == 'postgresql':
+            explain_options = {'analyze': True, 'buffers': True}
+        for name, queryset in queries.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(queryset[:10].explain(**explain_options))
+            self.stdout.write('')
@@ -0,0 +1,34 @@
+from django.core.management import BaseCommand
+
+from recipes.exporters import EXPORT_CHUNK_SIZE, export_recipes
+from recipes.importers import open_text
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Export recipes as NDJSON accepted by import_data --model recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', help='Output file, standard output by default'
+        )
+        parser.add_argument(
+            '--author', nargs='+', help='Usernames of exported recipe authors'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE
+        )
+
+    def handle(self, *args, **options):
+        queryset = Recipe.objects.all()
+        if options['author']:
+            queryset = queryset.filter(
+                author__username__in=options['author']
+            )
+        lines = export_recipes(queryset, options['chunk_size'])
+        if not options['path']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        with open_text(options['path'], 'w') as file:
+            file.writelines(lines)
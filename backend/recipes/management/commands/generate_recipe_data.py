@@ -0,0 +1,71 @@
+import json
+import os
+import random
+
+from django.core.management import BaseCommand
+
+UNITS = ('г', 'мл', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = (
+    'суп', 'салат', 'пирог', 'соус', 'рагу', 'запеканка', 'каша', 'омлет',
+    'паста', 'котлеты', 'блины', 'плов', 'гуляш', 'ризотто', 'торт',
+    'томатный', 'грибной', 'куриный', 'овощной', 'сырный', 'быстрый',
+    'домашний', 'острый', 'сладкий', 'летний', 'постный', 'праздничный',
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate deterministic NDJSON data set for import benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Directory for NDJSON files')
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        os.makedirs(options['output'], exist_ok=True)
+        users = [f'bench_user_{number}' for number in range(options['users'])]
+        tags = [f'bench-tag-{number}' for number in range(options['tags'])]
+        ingredients = [
+            (f'ингредиент {number}', UNITS[number % len(UNITS)])
+            for number in range(options['ingredients'])
+        ]
+        # Popular ingredients (salt, oil, ...) are used much more often
+        weights = [1 / rank for rank in range(1, len(ingredients) + 1)]
+
+        self.write(options['output'], 'users.ndjson', (
+            {'username': username, 'email': f'{username}@example.com'}
+            for username in users
+        ))
+        self.write(options['output'], 'tags.ndjson', (
+            {'name': slug, 'color': f'#{number:06X}', 'slug': slug}
+            for number, slug in enumerate(tags)
+        ))
+        self.write(options['output'], 'recipes.ndjson', (
+            {
+                'author': rng.choice(users),
+                'name': f'{" ".join(rng.sample(WORDS, 3))} {number}',
+                'text': ' '.join(rng.choices(WORDS, k=30)),
+                'cooking_time': rng.randint(5, 180),
+                'tags': rng.sample(tags, rng.randint(1, min(3, len(tags)))),
+                'ingredients': [
+                    {'name': name, 'measurement_unit': unit,
+                     'amount': rng.randint(1, 500)}
+                    for name, unit in dict.fromkeys(rng.choices(
+                        ingredients, weights, k=rng.randint(3, 12)
+                    ))
+                ],
+            }
+            for number in range(options['recipes'])
+        ))
+
+    def write(self, directory, name, records):
+        path = os.path.join(directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            for record in records:
+                file.write(json.dumps(record, ensure_ascii=False))
+                file.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'Записан файл {path}.'))
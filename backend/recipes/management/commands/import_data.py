@@ -1,22 +1,141 @@
-import csv
+import os
+import time
 
 from django.conf import settings
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from recipes.models import Ingredient
+from api.v1.cache import invalidate_model, purge_surrogate_keys
+from recipes.importers import (LOADERS, READERS, copy_csv, import_records,
+                               open_text)
+from recipes.models import Ingredient, Tag
+
+
+# CSV files larger than that are loaded with COPY on PostgreSQL
+COPY_THRESHOLD = 50 * 1024 * 1024
 
 
 class Command(BaseCommand):
     help = 'Ingredient data import'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(
+                settings.BASE_DIR, 'static/data/ingredients.csv'
+            ),
+            help='Data file, ingredients.csv from static data by default'
+        )
+        parser.add_argument(
+            '--model', choices=LOADERS, default='ingredients',
+            help='Kind of imported records'
+        )
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='File format, detected by extension by default'
+        )
+        parser.add_argument(
+            '--fields',
+            help='Comma-separated CSV columns for files without header, '
+                 'name,measurement_unit for ingredients'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Validate and load data rolling every batch back'
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Load CSV with COPY into staging table (PostgreSQL only), '
+                 'used by default for large files'
+        )
+
     def handle(self, *args, **options):
-        with open(
-            f'{settings.BASE_DIR}/static/data/ingredients.csv',
-                encoding='utf-8') as f:
-            '''Read as dict'''
-            reader = csv.DictReader(f)
-            Ingredient.objects.bulk_create(
-                Ingredient(**content) for content in reader
+        file_format = options['format'] or os.path.splitext(
+            options['path']
+        )[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {file_format}.')
+        loader = LOADERS[options['model']]()
+        fieldnames = (
+            options['fields'].split(',') if options['fields']
+            else getattr(loader, 'csv_fields', None)
+        )
+        model = loader.model
+        before = model.objects.count()
+        started = time.perf_counter()
+
+        can_copy = (
+            file_format == 'csv'
+            and connection.vendor == 'postgresql'
+            and hasattr(loader, 'copy_columns')
+        )
+        use_copy = options['copy'] or (
+            can_copy and os.path.getsize(options['path']) > COPY_THRESHOLD
+        )
+        with open_text(options['path']) as file:
+            if use_copy:
+                if not can_copy:
+                    raise CommandError(
+                        'COPY доступен только для CSV с ингредиентами '
+                        'или тегами в PostgreSQL.'
+                    )
+                try:
+                    processed = copy_csv(
+                        loader, file, fieldnames, options['dry_run']
+                    )
+                except ValueError as error:
+                    raise CommandError(error)
+                errors, updated, created_ingredients = [], 0, 0
+            else:
+                reader = READERS[file_format]
+                records = (
+                    reader(file, fieldnames) if file_format == 'csv'
+                    else reader(file)
+                )
+                result = import_records(
+                    loader, records, options['batch_size'],
+                    options['dry_run'], self.progress(started, options)
+                )
+                processed, errors = result.processed, result.errors
+                updated = result.updated
+                created_ingredients = result.created_ingredients
+
+        elapsed = time.perf_counter() - started
+        if not options['dry_run']:
+            self.refresh_indexes(options['model'], created_ingredients)
+        for number, message in errors[:100]:
+            self.stderr.write(f'Запись {number}: {message}')
+        created = model.objects.count() - before
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные загружены. Обработано: {processed}, '
+            f'добавлено: {created}, обновлено: {updated}, '
+            f'ошибок: {len(errors)}, '
+            f'{elapsed:.2f} с ({processed / (elapsed or 1):.0f} записей/с).'
+        ))
+
+    def progress(self, started, options):
+        if options['verbosity'] < 2:
+            return None
+
+        def report(result):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{result.processed} записей, {len(result.errors)} ошибок, '
+                f'{result.processed / (elapsed or 1):.0f} записей/с'
             )
+        return report
 
-        self.stdout.write(self.style.SUCCESS('Данные загружены.'))
+    def refresh_indexes(self, model, created_ingredients=0):
+        # Recipe loader refreshes recipe indexes itself
+        if model in ('ingredients', 'tags'):
+            invalidate_model(LOADERS[model].model)
+        if created_ingredients:
+            transaction.on_commit(lambda: invalidate_model(Ingredient))
+        if model == 'tags':
+            # Existing tags may be renamed, ingredients are only added
+            purge_surrogate_keys(*(
+                f'tag-{pk}' for pk in Tag.objects.values_list('pk', flat=True)
+            ))
+        elif model == 'recipes':
+            purge_surrogate_keys('recipes')
@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from recipes.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recompute recipe full-text search data'
+
+    def handle(self, *args, **options):
+        update_search_vectors()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс обновлен.'))
@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Rebuild shopping list totals from users\' carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, nargs='*', dest='users',
+            help='Rebuild lists of given user ids only'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            ShoppingListItem.objects.rebuild(options['users'])
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны.'))
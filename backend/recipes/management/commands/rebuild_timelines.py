@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.timelines import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = 'Refill recipe feed timelines from subscriptions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, nargs='*', dest='users',
+            help='Rebuild timelines of given user ids only'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_timelines(options['users'])
+        self.stdout.write(self.style.SUCCESS('Ленты подписок обновлены.'))
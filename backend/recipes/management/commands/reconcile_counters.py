@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+
+from recipes.counters import reconcile_recipe_counters, reconcile_user_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized recipe and user counters'
+
+    def handle(self, *args, **options):
+        fixed = {**reconcile_recipe_counters(), **reconcile_user_counters()}
+        for field, amount in fixed.items():
+            self.stdout.write(f'{field}: исправлено {amount}')
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны.'))
@@ -0,0 +1,215 @@
+import random
+from itertools import accumulate
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from api.v1.cache import invalidate_model
+from recipes.counters import (reconcile_recipe_counters,
+                              reconcile_user_counters)
+from recipes.matching import bump_version
+from recipes.models import (Cart, FavoriteRecipe, Follow, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingListItem, Tag)
+from recipes.ranking import update_trending_scores
+from recipes.search import update_search_vectors
+from recipes.timelines import rebuild_timelines
+from users.models import CustomUser
+
+UNITS = ('г', 'мл', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+WORDS = (
+    'суп', 'салат', 'пирог', 'соус', 'рагу', 'запеканка', 'каша', 'омлет',
+    'паста', 'котлеты', 'блины', 'плов', 'гуляш', 'ризотто', 'торт',
+    'томатный', 'грибной', 'куриный', 'овощной', 'сырный', 'быстрый',
+    'домашний', 'острый', 'сладкий', 'летний', 'постный', 'праздничный',
+)
+
+
+def zipf_weights(size, skew):
+    '''Cumulative weights of ranks 1..size in Zipf distribution.'''
+    return list(accumulate(1 / rank ** skew for rank in range(1, size + 1)))
+
+
+class Command(BaseCommand):
+    help = 'Fill database with deterministic synthetic data for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Mean number of subscriptions per user'
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Mean number of favorite recipes per user'
+        )
+        parser.add_argument(
+            '--cart', type=int, default=8,
+            help='Mean number of recipes in user shopping cart'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Zipf exponent of author, recipe and ingredient popularity'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='bench')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        prefix = options['prefix']
+        with transaction.atomic():
+            # Data of previous run with the same prefix is replaced
+            self.clear(prefix)
+            users = self.create_users(prefix)
+            tags = self.create_tags(prefix)
+            ingredients = self.create_ingredients(prefix)
+            recipes = self.create_recipes(prefix, users, tags, ingredients)
+            self.create_relations(users, recipes)
+            ShoppingListItem.objects.rebuild(users)
+            reconcile_recipe_counters()
+            reconcile_user_counters()
+            update_trending_scores()
+            rebuild_timelines(users)
+        update_search_vectors()
+        bump_version()
+        invalidate_model(Ingredient)
+        invalidate_model(Tag)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные созданы: {len(users)} пользователей, '
+            f'{len(recipes)} рецептов.'
+        ))
+
+    def clear(self, prefix):
+        CustomUser.objects.filter(username__startswith=f'{prefix}_').delete()
+        Tag.objects.filter(slug__startswith=f'{prefix}-').delete()
+        Ingredient.objects.filter(name__startswith=f'{prefix} ').delete()
+
+    def bulk_create(self, model, objects):
+        model.objects.bulk_create(
+            objects, self.options['batch_size'], ignore_conflicts=True
+        )
+
+    def create_users(self, prefix):
+        users = []
+        for number in range(self.options['users']):
+            user = CustomUser(
+                username=f'{prefix}_{number}',
+                email=f'{prefix}_{number}@example.com',
+                first_name=f'Имя {number}',
+                last_name=f'Фамилия {number}',
+            )
+            user.set_unusable_password()
+            users.append(user)
+        self.bulk_create(CustomUser, users)
+        return list(
+            CustomUser.objects.filter(
+                username__in=[user.username for user in users]
+            ).order_by('id').values_list('id', flat=True)
+        )
+
+    def create_tags(self, prefix):
+        self.bulk_create(Tag, (
+            Tag(
+                name=f'{prefix} тег {number}',
+                color=f'#{self.rng.randrange(0x1000000):06X}',
+                slug=f'{prefix}-{number}'
+            )
+            for number in range(self.options['tags'])
+        ))
+        return list(
+            Tag.objects.filter(slug__startswith=f'{prefix}-')
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def create_ingredients(self, prefix):
+        self.bulk_create(Ingredient, (
+            Ingredient(
+                name=f'{prefix} ингредиент {number}',
+                measurement_unit=UNITS[number % len(UNITS)]
+            )
+            for number in range(self.options['ingredients'])
+        ))
+        return list(
+            Ingredient.objects.filter(name__startswith=f'{prefix} ')
+            .order_by('id').values_list('id', flat=True)
+        )
+
+    def create_recipes(self, prefix, users, tags, ingredients):
+        rng, skew = self.rng, self.options['skew']
+        author_weights = zipf_weights(len(users), skew)
+        authors = rng.choices(
+            users, cum_weights=author_weights, k=self.options['recipes']
+        )
+        self.bulk_create(Recipe, (
+            Recipe(
+                author_id=author_id,
+                name=f'{" ".join(rng.sample(WORDS, 3))} {prefix} {number}',
+                text=' '.join(rng.choices(WORDS, k=40)),
+                image=f'recipes/images/{prefix}.png',
+                cooking_time=rng.randint(5, 180),
+            )
+            for number, author_id in enumerate(authors)
+        ))
+        recipes = list(
+            Recipe.objects.filter(author_id__in=users)
+            .order_by('id').values_list('id', flat=True)
+        )
+
+        ingredient_weights = zipf_weights(len(ingredients), skew)
+        recipe_ingredients, recipe_tags = [], []
+        for recipe_id in recipes:
+            chosen = dict.fromkeys(rng.choices(
+                ingredients, cum_weights=ingredient_weights,
+                k=rng.randint(3, 12)
+            ))
+            recipe_ingredients.extend(
+                RecipeIngredient(
+                    recipe_id=recipe_id,
+                    ingredient_id=ingredient_id,
+                    amount=rng.randint(1, 500)
+                )
+                for ingredient_id in chosen
+            )
+            recipe_tags.extend(
+                Recipe.tags.through(recipe_id=recipe_id, tag_id=tag_id)
+                for tag_id in rng.sample(tags, min(len(tags), 2))
+            )
+        self.bulk_create(RecipeIngredient, recipe_ingredients)
+        self.bulk_create(Recipe.tags.through, recipe_tags)
+        return recipes
+
+    def create_relations(self, users, recipes):
+        rng, skew = self.rng, self.options['skew']
+        user_weights = zipf_weights(len(users), skew)
+        recipe_weights = zipf_weights(len(recipes), skew)
+        follows, favorites, carts = [], [], []
+        for user_id in users:
+            following = dict.fromkeys(rng.choices(
+                users, cum_weights=user_weights,
+                k=rng.randint(0, 2 * self.options['follows'])
+            ))
+            follows.extend(
+                Follow(user_id=user_id, following_id=following_id)
+                for following_id in following if following_id != user_id
+            )
+            favorites.extend(
+                FavoriteRecipe(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in dict.fromkeys(rng.choices(
+                    recipes, cum_weights=recipe_weights,
+                    k=rng.randint(0, 2 * self.options['favorites'])
+                ))
+            )
+            carts.extend(
+                Cart(user_id=user_id, recipe_id=recipe_id)
+                for recipe_id in dict.fromkeys(rng.choices(
+                    recipes, cum_weights=recipe_weights,
+                    k=rng.randint(0, 2 * self.options['cart'])
+                ))
+            )
+        self.bulk_create(Follow, follows)
+        self.bulk_create(FavoriteRecipe, favorites)
+        self.bulk_create(Cart, carts)
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.ranking import update_trending_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute time-decayed trending scores of recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        scored, reset = update_trending_scores(
+            batch_size=options['batch_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг обновлен: {scored} рецептов, сброшено {reset}, '
+            f'{time.perf_counter() - started:.2f} с.'
+        ))
@@ -0,0 +1,117 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from itertools import chain
+
+from django.core.cache import cache
+
+VERSION_KEY = 'version:recipes.ingredient_recipes'
+
+
+class IngredientRecipeIndex:
+    '''Inverted index from ingredient to recipes using it.
+
+    Every ingredient keeps a sorted array of recipe ids, so a set of
+    available ingredients is matched against all recipes by counting ids
+    in a few arrays instead of a relational division query. Arrays and
+    recipe sizes are never changed in place: updates publish new copies,
+    so matching reads a consistent snapshot without locking.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        # Arrays of recipe ids by ingredient and ingredient counts by recipe
+        self.data = ({}, {})
+
+    def build(self):
+        from .models import RecipeIngredient
+
+        recipes = defaultdict(lambda: array('q'))
+        sizes = defaultdict(int)
+        for ingredient_id, recipe_id in RecipeIngredient.objects.order_by(
+            'ingredient_id', 'recipe_id'
+        ).values_list('ingredient_id', 'recipe_id').iterator():
+            recipes[ingredient_id].append(recipe_id)
+            sizes[recipe_id] += 1
+        self.data = (dict(recipes), dict(sizes))
+
+    def refresh(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            version = bump_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.build()
+                self._version = version
+
+    def update(self, recipe_id):
+        '''Reindex one recipe, other processes rebuild their indexes.'''
+        from .models import RecipeIngredient
+
+        with self._lock:
+            if self._version is None or self._version != cache.get(
+                VERSION_KEY
+            ):
+                bump_version()
+                return
+            ingredient_ids = list(
+                RecipeIngredient.objects.filter(
+                    recipe_id=recipe_id
+                ).values_list('ingredient_id', flat=True)
+            )
+            recipes, sizes = (dict(mapping) for mapping in self.data)
+            for ingredient_id, recipe_ids in recipes.items():
+                position = bisect_left(recipe_ids, recipe_id)
+                if position < len(recipe_ids) and (
+                    recipe_ids[position] == recipe_id
+                ):
+                    recipe_ids = array('q', recipe_ids)
+                    del recipe_ids[position]
+                    recipes[ingredient_id] = recipe_ids
+            sizes.pop(recipe_id, None)
+            for ingredient_id in ingredient_ids:
+                recipe_ids = array('q', recipes.get(ingredient_id, ()))
+                insort(recipe_ids, recipe_id)
+                recipes[ingredient_id] = recipe_ids
+            if ingredient_ids:
+                sizes[recipe_id] = len(ingredient_ids)
+            self.data = (recipes, sizes)
+            self._version = bump_version()
+
+    def match(self, ingredient_ids, limit=None):
+        '''Rank recipes by missing, then matched ingredients amount.
+
+        Returns (recipe id, matched, missing) tuples, recipes fully covered
+        by given ingredients go first.
+        '''
+        self.refresh()
+        recipes, sizes = self.data
+        matched = Counter(chain.from_iterable(
+            recipes[ingredient_id] for ingredient_id in set(ingredient_ids)
+            if ingredient_id in recipes
+        ))
+        ranked = (
+            (recipe_id, count, sizes[recipe_id] - count)
+            for recipe_id, count in matched.items()
+        )
+
+        def key(item):
+            return item[2], -item[1], -item[0]
+
+        if limit:
+            return heapq.nsmallest(limit, ranked, key=key)
+        return sorted(ranked, key=key)
+
+
+def bump_version():
+    # Increment is atomic, so concurrent writes publish distinct versions
+    cache.add(VERSION_KEY, 0, None)
+    return cache.incr(VERSION_KEY)
+
+
+ingredient_recipe_index = IngredientRecipeIndex()
@@ -0,0 +1,40 @@
+from django.db import migrations
+
+from recipes.search import UPDATE_VECTOR_SQL
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector'
+    )
+    schema_editor.execute(
+        'CREATE INDEX recipe_search_vector_idx '
+        'ON recipes_recipe USING gin (search_vector)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX recipe_name_trgm_idx '
+        'ON recipes_recipe USING gin (name gin_trgm_ops)'
+    )
+    schema_editor.execute(UPDATE_VECTOR_SQL)
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_name_trgm_idx')
+    schema_editor.execute(
+        'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:54
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def date_existing_rows(apps, schema_editor):
+    # Real time of existing rows is unknown, so they are put before the
+    # trending window instead of counting as activity of the deploy moment
+    created = django.utils.timezone.now() - timedelta(
+        hours=settings.TRENDING_HALF_LIFE_HOURS
+    ) * (settings.TRENDING_WINDOW_HALF_LIVES + 1)
+    for name in ('Cart', 'FavoriteRecipe'):
+        apps.get_model('recipes', name).objects.update(created=created)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='favoriterecipe',
+            name='created',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, verbose_name='Рейтинг популярности за последнее время'),
+        ),
+        migrations.RunPython(date_existing_rows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['created'], name='cart_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='favoriterecipe',
+            index=models.Index(fields=['created'], name='favorite_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-pub_date'], name='recipe_trending_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber, Upper
 
 from .validators import color_validation
 from users.models import CustomUser
@@ -54,11 +56,80 @@ class Ingredient(models.Model):
                 name='unique_ingredient'
             ),
         ]
+        indexes = [
+            models.Index(Upper('name'), name='ingredient_upper_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    '''Recipe queryset with user-specific and feed-ready data.'''
+
+    def with_user_flags(self, user):
+        '''Annotate favorite/cart status of recipes for the given user.'''
+        if not user.is_authenticated:
+            false = models.Value(False, output_field=models.BooleanField())
+            return self.annotate(
+                is_favorited=false,
+                is_in_shopping_cart=false
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                FavoriteRecipe.objects.filter(
+                    user=user, recipe=models.OuterRef('pk')
+                )
+            ),
+            is_in_shopping_cart=models.Exists(
+                Cart.objects.filter(user=user, recipe=models.OuterRef('pk'))
+            )
+        )
+
+    def for_feed(self, user):
+        '''Load all data shown in recipe responses in constant queries.'''
+        if user.is_authenticated:
+            is_subscribed = models.Exists(
+                Follow.objects.filter(
+                    user=user, following=models.OuterRef('pk')
+                )
+            )
+        else:
+            is_subscribed = models.Value(
+                False, output_field=models.BooleanField()
+            )
+        return self.with_user_flags(user).prefetch_related(
+            models.Prefetch(
+                'author',
+                queryset=CustomUser.objects.annotate(
+                    is_subscribed=is_subscribed
+                )
+            ),
+            models.Prefetch('tags', queryset=Tag.objects.all()),
+            models.Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+
+    def latest_per_author(self, limit):
+        '''Keep only given number of the latest recipes of every author.'''
+        ranked = self.annotate(
+            author_position=models.Window(
+                expression=RowNumber(),
+                partition_by=[models.F('author_id')],
+                order_by=[models.F('pub_date').desc(), models.F('id').desc()]
+            )
+        ).values('id', 'author_position')
+        sql, params = ranked.query.sql_with_params()
+        return self.filter(pk__in=RawSQL(
+            f'SELECT id FROM ({sql}) AS ranked WHERE author_position <= %s',
+            (*params, limit)
+        ))
+
+
 class Recipe(models.Model):
     '''Base recipe model.'''
     name = models.CharField(max_length=200, verbose_name='Название блюда',)
@@ -81,6 +152,12 @@ class Recipe(models.Model):
         blank=False,
         verbose_name='Изображение'
     )
+    image_renditions = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
     tags = models.ManyToManyField(
         Tag,
         related_name='tags',
@@ -91,13 +168,47 @@ class Recipe(models.Model):
         validators=[MinValueValidator(1), ]
     )
 
-    pub_date = models.DateTimeField(auto_now=True,
+    pub_date = models.DateTimeField(auto_now_add=True,
                                     verbose_name='Дата публикации')
+    updated = models.DateTimeField(auto_now=True,
+                                   verbose_name='Дата изменения')
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Рейтинг популярности за последнее время'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-pub_date', ]
+        indexes = [
+            models.Index(
+                fields=('author', '-pub_date'),
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(fields=('-pub_date',), name='recipe_pub_date_idx'),
+            models.Index(
+                fields=('-favorites_count', '-pub_date'),
+                name='recipe_popular_idx'
+            ),
+            models.Index(
+                fields=('-trending_score', '-pub_date'),
+                name='recipe_trending_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -147,6 +258,10 @@ class FavoriteRecipe(models.Model):
         related_name='favorites',
         verbose_name='рецепт'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Избранный рецепт'
@@ -157,6 +272,13 @@ class FavoriteRecipe(models.Model):
                 name='unique_favorite'
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'),
+                name='favorite_recipe_user_idx'
+            ),
+            models.Index(fields=('created',), name='favorite_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user} добавил в избранное {self.recipe}.'
@@ -206,6 +328,10 @@ class Cart(models.Model):
         related_name='cart',
         verbose_name='рецепты'
     )
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления'
+    )
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -217,6 +343,220 @@ class Cart(models.Model):
                 name='unique_cart_recipe',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=('recipe', 'user'),
+                name='cart_recipe_user_idx'
+            ),
+            models.Index(fields=('created',), name='cart_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.recipe} в списке покупок у {self.user}'
+
+
+class ShoppingListItemManager(models.Manager):
+    '''Incremental maintenance of users' shopping list totals.'''
+
+    def add_amounts(self, user_ids, amounts):
+        '''Add ingredient amounts (negative to subtract) to users' lists.'''
+        user_ids = list(user_ids)
+        amounts = {
+            ingredient_id: amount
+            for ingredient_id, amount in amounts.items() if amount
+        }
+        if not user_ids or not amounts:
+            return
+        self.bulk_create(
+            [
+                self.model(
+                    user_id=user_id,
+                    ingredient_id=ingredient_id,
+                    total_amount=0
+                )
+                for user_id in user_ids
+                for ingredient_id, amount in amounts.items() if amount > 0
+            ],
+            ignore_conflicts=True
+        )
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=amounts)
+        items.update(
+            total_amount=models.F('total_amount') + models.Case(
+                *[
+                    models.When(ingredient_id=ingredient_id, then=amount)
+                    for ingredient_id, amount in amounts.items()
+                ],
+                default=0,
+                output_field=models.IntegerField()
+            )
+        )
+        items.filter(total_amount__lte=0).delete()
+
+    def add_recipe(self, user, recipe):
+        self.add_amounts([user.id], get_recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        self.add_amounts(
+            [user.id],
+            {
+                ingredient_id: -amount for ingredient_id, amount
+                in get_recipe_amounts(recipe).items()
+            }
+        )
+
+    def add_recipes(self, user, recipe_ids):
+        self.add_amounts([user.id], get_recipe_amounts(recipe_ids))
+
+    def remove_recipes(self, user, recipe_ids):
+        self.add_amounts(
+            [user.id],
+            {
+                ingredient_id: -amount for ingredient_id, amount
+                in get_recipe_amounts(recipe_ids).items()
+            }
+        )
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        '''Apply recipe ingredients change to lists of users having it.'''
+        self.add_amounts(
+            Cart.objects.filter(recipe=recipe).values_list(
+                'user_id', flat=True
+            ),
+            {
+                ingredient_id: (
+                    new_amounts.get(ingredient_id, 0)
+                    - old_amounts.get(ingredient_id, 0)
+                )
+                for ingredient_id in {*old_amounts, *new_amounts}
+            }
+        )
+
+    def expected_totals(self, user_ids=None):
+        '''Compute list totals from carts as (user, ingredient) mapping.'''
+        rows = RecipeIngredient.objects.order_by()
+        if user_ids is not None:
+            rows = rows.filter(recipe__cart__user_id__in=user_ids)
+        else:
+            rows = rows.filter(recipe__cart__isnull=False)
+        return {
+            (row['recipe__cart__user'], row['ingredient']): row['total']
+            for row in rows.values(
+                'recipe__cart__user', 'ingredient'
+            ).annotate(total=models.Sum('amount'))
+        }
+
+    def rebuild(self, user_ids=None):
+        '''Recreate shopping lists of given (or all) users from carts.'''
+        items = self.all()
+        if user_ids is not None:
+            user_ids = list(user_ids)
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        self.bulk_create(
+            self.model(
+                user_id=user_id,
+                ingredient_id=ingredient_id,
+                total_amount=total
+            )
+            for (user_id, ingredient_id), total
+            in self.expected_totals(user_ids).items()
+        )
+
+
+def get_recipe_amounts(recipe):
+    '''Get ingredient amounts of recipe (or list of ids) by ingredient id.'''
+    if isinstance(recipe, Recipe):
+        return dict(
+            RecipeIngredient.objects.filter(recipe=recipe).values_list(
+                'ingredient_id', 'amount'
+            )
+        )
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id__in=recipe).order_by()
+        .values('ingredient_id').annotate(total=models.Sum('amount'))
+        .values_list('ingredient_id', 'total')
+    )
+
+
+class ShoppingListItem(models.Model):
+    '''Ingredient total amount in user's cart recipes.'''
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='ингредиент',
+    )
+    total_amount = models.IntegerField(
+        default=0,
+        verbose_name='общее количество'
+    )
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        ordering = ['user', ]
+        constraints = [
+            models.constraints.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            ),
+        ]
+
+    def __str__(self):
+        return (f'{self.ingredient} ({self.total_amount}) '
+                f'в списке покупок у {self.user}')
+
+
+class TimelineEntry(models.Model):
+    '''Recipe of followed author delivered to user's feed.'''
+    user = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='рецепт'
+    )
+    author = models.ForeignKey(
+        CustomUser,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='автор'
+    )
+    # Copy of recipe's date, so a page of timeline is read by one index
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.constraints.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_entry',
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=('user', 'author'),
+                name='timeline_user_author_idx'
+            ),
+            models.Index(
+                fields=('user', '-pub_date', '-recipe'),
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
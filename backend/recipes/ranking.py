@@ -0,0 +1,54 @@
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Cart, FavoriteRecipe, Recipe
+
+# Contribution of a fresh event to the trending score
+TRENDING_WEIGHTS = (
+    (FavoriteRecipe, 1.0),
+    (Cart, 0.5),
+)
+
+
+def get_trending_scores(now):
+    '''Sum recent favorite/cart events decayed exponentially by age.'''
+    half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+    decay = math.log(2) / half_life.total_seconds()
+    since = now - half_life * settings.TRENDING_WINDOW_HALF_LIVES
+    scores = defaultdict(float)
+    for model, weight in TRENDING_WEIGHTS:
+        events = model.objects.filter(created__gte=since).values_list(
+            'recipe_id', 'created'
+        )
+        for recipe_id, created in events.iterator(chunk_size=10000):
+            age = (now - created).total_seconds()
+            scores[recipe_id] += weight * math.exp(-decay * age)
+    return scores
+
+
+def update_trending_scores(now=None, batch_size=1000):
+    '''Store current trending scores, reset ones without recent events.'''
+    scores = get_trending_scores(now or timezone.now())
+    stale = set(
+        Recipe.objects.filter(trending_score__gt=0).values_list(
+            'pk', flat=True
+        ).iterator()
+    ) - scores.keys()
+    stale = list(stale)
+    for start in range(0, len(stale), batch_size):
+        Recipe.objects.filter(
+            pk__in=stale[start:start + batch_size]
+        ).update(trending_score=0)
+    Recipe.objects.bulk_update(
+        [
+            Recipe(pk=recipe_id, trending_score=round(score, 6))
+            for recipe_id, score in scores.items()
+        ],
+        ('trending_score',),
+        batch_size=batch_size
+    )
+    return len(scores), len(stale)
@@ -0,0 +1,244 @@
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from difflib import get_close_matches
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'russian'
+# Field weights of recipe name, ingredient names and text
+NAME_WEIGHT = 3
+INGREDIENT_WEIGHT = 2
+TEXT_WEIGHT = 1
+PREFIX_SIMILARITY = 0.8
+VERSION_KEY = 'version:recipes.search'
+
+TOKEN_RE = re.compile(r'\w+')
+
+UPDATE_VECTOR_SQL = f'''
+    UPDATE recipes_recipe SET search_vector =
+        setweight(to_tsvector('{SEARCH_CONFIG}', name), 'A')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+            SELECT string_agg(ingredient.name, ' ')
+            FROM recipes_recipeingredient AS recipe_ingredient
+            JOIN recipes_ingredient AS ingredient
+                ON ingredient.id = recipe_ingredient.ingredient_id
+            WHERE recipe_ingredient.recipe_id = recipes_recipe.id
+        ), '')), 'B')
+        || setweight(to_tsvector('{SEARCH_CONFIG}', text), 'C')
+'''
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.casefold())
+
+
+class InvertedIndex:
+    '''In-process inverted index of recipe texts with ranked search.
+
+    Used on databases without full-text search support. Postings keep
+    weighted term frequencies, scores are TF-IDF with prefix and fuzzy
+    matching of query terms.
+    '''
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.documents = {}
+        self._terms = None
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, recipe_id, name, text, ingredients=()):
+        self.remove(recipe_id)
+        frequencies = defaultdict(int)
+        for weight, value in (
+            (NAME_WEIGHT, name),
+            (INGREDIENT_WEIGHT, ' '.join(ingredients)),
+            (TEXT_WEIGHT, text),
+        ):
+            for token in tokenize(value):
+                frequencies[token] += weight
+        for token, frequency in frequencies.items():
+            if token not in self.postings:
+                self._terms = None
+            self.postings[token][recipe_id] = frequency
+        self.documents[recipe_id] = tuple(frequencies)
+
+    def remove(self, recipe_id):
+        for token in self.documents.pop(recipe_id, ()):
+            postings = self.postings[token]
+            postings.pop(recipe_id, None)
+            if not postings:
+                del self.postings[token]
+                self._terms = None
+
+    @property
+    def terms(self):
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+        return self._terms
+
+    def expand(self, token):
+        '''Get vocabulary terms matching query token with similarity.'''
+        terms = self.terms
+        matches = {}
+        start = bisect_left(terms, token)
+        for term in terms[start:]:
+            if not term.startswith(token):
+                break
+            matches[term] = 1 if term == token else PREFIX_SIMILARITY
+        if not matches:
+            for term in get_close_matches(token, terms, n=3, cutoff=0.75):
+                matches[term] = PREFIX_SIMILARITY / 2
+        return matches
+
+    def search(self, query, limit=None):
+        '''Get (recipe id, score) pairs ordered by descending score.'''
+        scores = defaultdict(float)
+        total = len(self.documents) or 1
+        for token in set(tokenize(query)):
+            for term, similarity in self.expand(token).items():
+                postings = self.postings[term]
+                idf = math.log(1 + total / len(postings))
+                for recipe_id, frequency in postings.items():
+                    scores[recipe_id] += frequency * idf * similarity
+        key = itemgetter(1, 0)
+        if limit:
+            return heapq.nlargest(limit, scores.items(), key=key)
+        return sorted(scores.items(), key=key, reverse=True)
+
+
+class RecipeSearchIndex:
+    '''Process-wide inverted index kept in sync between workers.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self.index = InvertedIndex()
+
+    def build(self):
+        from .models import Recipe, RecipeIngredient
+
+        index = InvertedIndex()
+        ingredients = defaultdict(list)
+        for recipe_id, name in RecipeIngredient.objects.order_by().values_list(
+            'recipe_id', 'ingredient__name'
+        ).iterator():
+            ingredients[recipe_id].append(name)
+        for recipe_id, name, text in Recipe.objects.order_by().values_list(
+            'id', 'name', 'text'
+        ).iterator():
+            index.add(recipe_id, name, text, ingredients[recipe_id])
+        return index
+
+    def refresh(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            version = bump_version()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.index = self.build()
+                self._version = version
+
+    def update(self, recipe_id):
+        '''Reindex one recipe, other processes rebuild their indexes.'''
+        from .models import Recipe, RecipeIngredient
+
+        with self._lock:
+            if self._version is None or self._version != cache.get(
+                VERSION_KEY
+            ):
+                # Index is not built or outdated, it is rebuilt on search
+                bump_version()
+                return
+            recipe = Recipe.objects.filter(pk=recipe_id).values(
+                'name', 'text'
+            ).first()
+            if recipe is None:
+                self.index.remove(recipe_id)
+            else:
+                self.index.add(
+                    recipe_id, recipe['name'], recipe['text'],
+                    RecipeIngredient.objects.filter(
+                        recipe_id=recipe_id
+                    ).values_list('ingredient__name', flat=True)
+                )
+            self._version = bump_version()
+
+    def search(self, query, limit=None):
+        self.refresh()
+        return self.index.search(query, limit)
+
+
+def bump_version():
+    # Increment is atomic, so concurrent writes publish distinct versions
+    cache.add(VERSION_KEY, 0, None)
+    return cache.incr(VERSION_KEY)
+
+
+search_index = RecipeSearchIndex()
+
+
+def uses_full_text_search():
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vectors(recipe_ids=None):
+    '''Recompute stored search data of given (or all) recipes.'''
+    if not uses_full_text_search():
+        if recipe_ids is None:
+            bump_version()
+        for recipe_id in recipe_ids or ():
+            search_index.update(recipe_id)
+        return
+    sql, params = UPDATE_VECTOR_SQL, []
+    if recipe_ids is not None:
+        sql += ' WHERE id = ANY(%s)'
+        params.append(list(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def search_recipes(queryset, query):
+    '''Filter recipes matching the query ordered by relevance.'''
+    if uses_full_text_search():
+        rank = RawSQL(
+            f'ts_rank(recipes_recipe.search_vector, '
+            f'websearch_to_tsquery(\'{SEARCH_CONFIG}\', %s)) '
+            f'+ similarity(recipes_recipe.name, %s)',
+            (query, query),
+            output_field=models.FloatField()
+        )
+        matches = RawSQL(
+            f'recipes_recipe.search_vector @@ '
+            f'websearch_to_tsquery(\'{SEARCH_CONFIG}\', %s) '
+            f'OR recipes_recipe.name %% %s',
+            (query, query),
+            output_field=models.BooleanField()
+        )
+        return queryset.filter(matches).annotate(
+            search_rank=rank
+        ).order_by('-search_rank', '-pub_date', '-id')
+
+    ranked = search_index.search(query, settings.SEARCH_MAX_RESULTS)
+    if not ranked:
+        return queryset.none()
+    return queryset.filter(pk__in=[pk for pk, _ in ranked]).annotate(
+        search_rank=models.Case(
+            *[
+                models.When(pk=pk, then=models.Value(score))
+                for pk, score in ranked
+            ],
+            output_field=models.FloatField()
+        )
+    ).order_by('-search_rank', '-pub_date', '-id')
@@ -0,0 +1,138 @@
+import heapq
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Follow, Recipe, TimelineEntry
+
+
+def is_fanned_out(followers_count):
+    '''Recipes of authors with too many followers are read on request.'''
+    return followers_count <= settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out(recipe_ids):
+    '''Deliver new recipes to timelines of their authors' followers.'''
+    recipes = Recipe.objects.filter(
+        pk__in=recipe_ids,
+        author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('id', 'author_id', 'pub_date')
+    by_author = defaultdict(list)
+    for recipe_id, author_id, pub_date in recipes:
+        by_author[author_id].append((recipe_id, pub_date))
+    if not by_author:
+        return
+    followers = Follow.objects.filter(
+        following_id__in=by_author
+    ).values_list('following_id', 'user_id')
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                          author_id=author_id, pub_date=pub_date)
+            for author_id, user_id in followers.iterator()
+            for recipe_id, pub_date in by_author[author_id]
+        ),
+        batch_size=1000,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user, author):
+    '''Put latest recipes of newly followed author to user's timeline.'''
+    if not is_fanned_out(author.followers_count):
+        return
+    recipes = Recipe.objects.filter(author=author).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user=user, recipe_id=recipe_id, author=author,
+                          pub_date=pub_date)
+            for recipe_id, pub_date in recipes
+        ],
+        ignore_conflicts=True
+    )
+
+
+def prune(user, author):
+    '''Remove recipes of unfollowed author from user's timeline.'''
+    TimelineEntry.objects.filter(user=user, author=author).delete()
+
+
+def rebuild_timelines(user_ids=None):
+    '''Refill timelines of given (or all) users from subscriptions.'''
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.select_related('user', 'following')
+    if user_ids is not None:
+        user_ids = list(user_ids)
+        entries = entries.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    entries.delete()
+    for follow in follows.iterator():
+        backfill(follow.user, follow.following)
+
+
+def popular_authors(user):
+    return Follow.objects.filter(
+        user=user,
+        following__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values('following')
+
+
+def feed_condition(user):
+    '''Select recipes of user's timeline and of followed popular authors.'''
+    return (
+        Q(pk__in=TimelineEntry.objects.filter(user=user).values('recipe'))
+        | Q(author__in=popular_authors(user))
+    )
+
+
+class Timeline:
+    '''User's feed as a sliceable sequence of recipes for paginators.
+
+    Page of timeline is read by (user, -pub_date, -recipe) index and merged
+    with latest recipes of followed popular authors read by (author,
+    -pub_date) index, so feed does not join whole timeline with recipes.
+    '''
+
+    def __init__(self, user, queryset):
+        authors = popular_authors(user)
+        # Entries left from before author became popular are read by author
+        self.entries = TimelineEntry.objects.filter(user=user).exclude(
+            author__in=authors
+        ).order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )
+        self.popular = Recipe.objects.filter(author__in=authors).order_by(
+            '-pub_date', '-id'
+        ).values_list('pub_date', 'id')
+        self.queryset = queryset
+
+    def count(self):
+        return self.entries.count() + self.popular.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        recipe_ids = [
+            recipe_id for _, recipe_id in islice(
+                heapq.merge(
+                    self.entries[:stop], self.popular[:stop], reverse=True
+                ),
+                start, stop
+            )
+        ]
+        recipes = self.queryset.in_bulk(recipe_ids)
+        return [
+            recipes[recipe_id] for recipe_id in recipe_ids
+            if recipe_id in recipes
+        ]